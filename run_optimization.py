@@ -9,7 +9,8 @@ import pandas as pd
 from datetime import datetime
 
 # Import des modules
-from src.fngbt.data import load_fng_alt, load_btc_prices, merge_daily
+from src.fngbt.data import load_all, write_snapshot
+from src.fngbt.quality import check_quality, fill_gaps, quality_gate
 from src.fngbt.optimize import grid_search, optuna_search, default_search_space
 from src.fngbt.strategy import StrategyConfig
 from src.fngbt.backtest import run_backtest
@@ -27,17 +28,27 @@ def main():
     print("\n📊 Chargement des données...")
 
     try:
-        fng_df = load_fng_alt()
-        print(f"   ✓ Fear & Greed Index: {len(fng_df)} jours")
-
-        btc_df = load_btc_prices()
-        print(f"   ✓ Prix Bitcoin: {len(btc_df)} jours")
-
-        # Merge
-        df = merge_daily(fng_df, btc_df)
+        # Fear & Greed + prix BTC chargés en parallèle, puis fusionnés
+        df = load_all()
         print(f"   ✓ Données fusionnées: {len(df)} jours")
         print(f"   ✓ Période: {df['date'].min().date()} → {df['date'].max().date()}")
 
+        quality = check_quality(df)
+        if not quality.ok:
+            print(f"   ⚠️  Qualité: {quality.missing_days} jours manquants, {quality.dup_dates} doublons, "
+                  f"{len(quality.jumps)} sauts suspects")
+        if quality.missing_days or quality.dup_dates:
+            # Jours manquants recopiés depuis la veille (FNG et prix), doublons retirés
+            df = fill_gaps(df, policy="ffill")
+            print(f"   ✓ Trous comblés (ffill): {len(df)} jours")
+        # Bloque l'optimisation si les données restent inutilisables (NaN, trous, doublons)
+        quality_gate(df)
+
+        # Snapshot colonnaire versionné : le run reste rejouable à l'identique et
+        # d'autres process (Streamlit, workers) le relisent en memmap via `load_snapshot`
+        snapshot = write_snapshot(df)
+        print(f"   ✓ Snapshot: {snapshot}")
+
     except Exception as e:
         print(f"\n❌ Erreur lors du chargement des données: {e}")
         sys.exit(1)
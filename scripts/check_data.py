@@ -11,26 +11,18 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
 
 # Import direct du module pour éviter les problèmes d'exports partiels du package
 load_btc_prices = import_module("fngbt.data").load_btc_prices
+check_quality = import_module("fngbt.quality").check_quality
 
 
 DEF_START = "2013-01-01"
 
 
 def analyze_series(df: pd.DataFrame) -> dict:
-    df = df.copy().dropna(subset=["date", "close"]).sort_values("date").reset_index(drop=True)
-    dates = pd.DatetimeIndex(pd.to_datetime(df["date"], utc=True).tz_localize(None))
-    expected = pd.date_range(dates.min(), dates.max(), freq="D")
-    missing = expected.difference(dates)
-    duplicates = dates.duplicated().sum()
-    gaps = df.loc[df["date"].diff().dt.days > 1, ["date"]].assign(gap_days=lambda d: d["date"].diff().dt.days)
+    rep = check_quality(df, cols=("close",))
     return {
-        "start": dates.min(),
-        "end": dates.max(),
-        "rows": len(df),
-        "missing_days": len(missing),
-        "dup_dates": int(duplicates),
-        "max_gap_days": int(gaps["gap_days"].max()) if not gaps.empty else 0,
-        "gap_examples": gaps.head(5),
+        **rep.to_dict(),
+        "gap_examples": rep.gaps.head(5),
+        "jump_examples": rep.jumps.head(5),
     }
 
 
@@ -68,13 +60,16 @@ def main():
 
     print("=== Résumé données BTC-USD ===")
     for k, v in stats.items():
-        if k != "gap_examples":
+        if not k.endswith("_examples"):
             print(f"{k:>14}: {v}")
     if not stats["gap_examples"].empty:
         print("\nExemples de gaps (>1 jour):")
         print(stats["gap_examples"])
     else:
         print("\nAucun gap détecté (>1 jour).")
+    if not stats["jump_examples"].empty:
+        print("\nExemples de sauts de prix suspects:")
+        print(stats["jump_examples"])
 
     if args.plot:
         plot_prices(df, Path(args.plot))
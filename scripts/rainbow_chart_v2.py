@@ -11,39 +11,27 @@ import pandas as pd
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
 
 from fngbt.data import load_btc_prices
+from fngbt.strategy import GENESIS, RAINBOW_QUANTILES, fit_rainbow_bands
 
-GENESIS = pd.Timestamp("2009-01-03")
 DEFAULT_START = "2013-01-01"
 DEFAULT_EXTEND = "2025-12-31"
 
 
-def _log_regression(dates: pd.Series, prices: pd.Series) -> tuple[float, float]:
-    days = (dates - GENESIS).dt.days.clip(lower=1).astype(float)
-    x = np.log10(days)
-    y = np.log10(prices.clip(lower=1e-9))
-    slope, intercept = np.polyfit(x, y, deg=1)
-    return slope, intercept
-
-
 def build_rainbow_v2(px: pd.DataFrame, extend_to: str | None = None) -> pd.DataFrame:
     df = px.copy().dropna(subset=["date", "close"]).sort_values("date").reset_index(drop=True)
     if df.empty:
         raise ValueError("Aucune donnée BTC pour construire le Rainbow Chart.")
 
-    slope, intercept = _log_regression(df["date"], df["close"])
-    quantiles = [0.02, 0.10, 0.20, 0.35, 0.50, 0.65, 0.80, 0.90, 0.98]
-    deviation = np.log10(df["close"].clip(lower=1e-12)) - (
-        intercept + slope * np.log10((df["date"] - GENESIS).dt.days.clip(lower=1).astype(float))
-    )
-    band_devs = np.quantile(deviation, quantiles)
+    quantiles = RAINBOW_QUANTILES
+    slope, intercept, band_devs = fit_rainbow_bands(df["date"], df["close"], quantiles)
 
     def _lines(dates: Iterable[pd.Timestamp]) -> pd.DataFrame:
         dates = pd.to_datetime(pd.Index(dates)).sort_values()
-        days = (dates - GENESIS).days.clip(lower=1).astype(float)
+        days = np.clip((dates - GENESIS).days, 1, None).astype(float)
         log_mid = intercept + slope * np.log10(days)
         out = pd.DataFrame({"date": dates, "rainbow_base": 10 ** log_mid})
         for q, d in zip(quantiles, band_devs):
-            out[f"rainbow_band_{int(q * 100):02d}"] = 10 ** (log_mid + d)
+            out[f"rainbow_band_{int(round(q * 100)):02d}"] = 10 ** (log_mid + d)
         return out
 
     end_date = pd.to_datetime(extend_to) if extend_to else df["date"].max()
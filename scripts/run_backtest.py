@@ -8,9 +8,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
 from fngbt import (
     StrategyConfig,
     build_signals,
-    load_btc_prices,
-    load_fng_alt,
-    merge_daily,
+    load_all,
     plot_overview,
     run_backtest,
     to_weekly,
@@ -48,9 +46,7 @@ def parse_args():
 def main():
     args = parse_args()
 
-    fng = load_fng_alt()
-    px = load_btc_prices(start=fng["date"].min())
-    df = merge_daily(fng, px)
+    df = load_all()
     if args.weekly:
         df = to_weekly(df, how="last")
     if args.lookback_years:
@@ -13,9 +13,7 @@ from fngbt import (
     build_signals,
     default_search_space,
     grid_search_full,
-    load_btc_prices,
-    load_fng_alt,
-    merge_daily,
+    load_all,
     optuna_search,
     plot_overview,
     run_backtest,
@@ -128,19 +126,13 @@ def main():
     args = parse_args()
     OUT.mkdir(parents=True, exist_ok=True)
 
-    fng = load_fng_alt()
-    px = load_btc_prices(start=fng["date"].min())
-    df = merge_daily(fng, px)
+    df = load_all()
     if args.weekly:
         df = to_weekly(df, how="last")
     if args.lookback_years:
         cutoff = df["date"].max() - pd.Timedelta(days=int(args.lookback_years * 365))
         df = df[df["date"] >= cutoff].reset_index(drop=True)
 
-    # Prépare un FNG très lissé (ema200) utilisable via fng_source_col
-    if "fng" in df.columns:
-        df["ema200_soft"] = df["fng"].ewm(span=200, adjust=False).mean()
-
     step = max(1, int(args.fng_step))
     level_counts = [max(3, int(x)) for x in _parse_grid(args.fng_levels, int)]
     fng_buy_combos = list(
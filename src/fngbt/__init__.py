@@ -8,13 +8,51 @@ Package fngbt - Bitcoin strategy based on Fear & Greed Index and Rainbow Chart
 __all__ = [
     "load_fng_alt",
     "load_btc_prices",
+    "download_btc_prices",
+    "read_price_csv",
+    "load_all",
     "merge_daily",
+    "write_snapshot",
+    "load_snapshot",
     "to_weekly",
+    "resample",
+    "ResamplePyramid",
+    "append_daily",
+    "append_weekly",
+    "check_quality",
+    "fill_gaps",
+    "quality_gate",
+    "check_csv_files",
+    "IndicatorStore",
     "StrategyConfig",
+    "FeatureFrame",
+    "StrategyState",
+    "fit_rainbow_bands",
     "build_signals",
+    "build_signals_lean",
+    "fng_level_score",
+    "fng_level_score_batch",
+    "score_table",
+    "allocation_table",
+    "calculate_allocation_batch",
+    "build_positions_batch",
+    "filter_min_change",
+    "filter_min_change_batch",
     "run_backtest",
+    "backtest_arrays",
+    "run_backtest_batch",
+    "MetricsAccumulator",
+    "compute_metrics_batch",
+    "rolling_metrics",
+    "rolling_sharpe",
+    "rolling_vol",
+    "rolling_max_drawdown",
+    "rolling_exposure",
     "grid_search",
     "optuna_search",
     "evaluate_config",
+    "evaluate_configs",
     "default_search_space",
+    "monte_carlo",
+    "bootstrap_indices",
 ]
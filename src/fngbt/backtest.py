@@ -3,53 +3,313 @@ Backtest simple d'une stratégie d'allocation Bitcoin
 
 Simule l'achat/vente de BTC avec frais proportionnels au turnover
 """
+from __future__ import annotations
+import math
+from typing import Iterable
 import pandas as pd
 import numpy as np
-from .metrics import compute_metrics
+from .metrics import ANN
+from .quality import DEFAULT_MAX_GAP_DAYS, quality_gate
 
+try:  # numba optionnel : noyau compilé en une seule passe
+    from numba import njit
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    njit = None
 
-def run_backtest(df: pd.DataFrame, fees_bps: float = 10.0) -> dict:
+# Ordre des statistiques renvoyées par le noyau
+_STATS = (
+    "EquityFinal", "BHEquityFinal", "mean", "std", "bh_std", "neg_std",
+    "MaxDD", "BHMaxDD", "trades", "turnover_total", "weight_sum",
+)
+
+
+def _backtest_loop(close, pos, fee_rate, start, ret, turnover, strategy_ret, equity, bh_equity):
     """
-    Backtest long-only avec allocation variable
+    Une passe sur les jours : remplit les buffers et accumule les statistiques
+    (moyenne/variance de Welford, drawdown courant) sur les jours [start:].
+    """
+    n = close.shape[0]
+    eq = 1.0
+    bh = 1.0
+    prev_w = 0.0
+    k = 0
+    mean = m2 = 0.0
+    bh_mean = bh_m2 = 0.0
+    kn = 0
+    neg_mean = neg_m2 = 0.0
+    peak = bh_peak = 0.0
+    mdd = bh_mdd = 0.0
+    trades = 0.0
+    turnover_total = 0.0
+    weight_sum = 0.0
+    for i in range(n):
+        r = 0.0
+        if i > 0:
+            r = close[i] / close[i - 1] - 1.0
+            if r != r:  # NaN
+                r = 0.0
+        w = pos[i]
+        if w != w:
+            w = 0.0
+        w = w / 100.0
+        to = abs(w - prev_w)
+        prev_w = w
+        sr = w * r - to * fee_rate
+        eq *= 1.0 + sr
+        bh *= 1.0 + r
+        ret[i] = r
+        turnover[i] = to
+        strategy_ret[i] = sr
+        equity[i] = eq
+        bh_equity[i] = bh
+        turnover_total += to
+        weight_sum += w
+        if i < start:
+            continue
+        k += 1
+        delta = sr - mean
+        mean += delta / k
+        m2 += delta * (sr - mean)
+        delta = r - bh_mean
+        bh_mean += delta / k
+        bh_m2 += delta * (r - bh_mean)
+        if sr < 0:
+            kn += 1
+            delta = sr - neg_mean
+            neg_mean += delta / kn
+            neg_m2 += delta * (sr - neg_mean)
+        if to > 1e-6:
+            trades += 1.0
+        if eq > peak:
+            peak = eq
+        if bh > bh_peak:
+            bh_peak = bh
+        mdd = min(mdd, eq / peak - 1.0)
+        bh_mdd = min(bh_mdd, bh / bh_peak - 1.0)
+    nan = math.nan
+    std = math.sqrt(m2 / (k - 1)) if k > 1 else nan
+    bh_std = math.sqrt(bh_m2 / (k - 1)) if k > 1 else nan
+    neg_std = math.sqrt(neg_m2 / (kn - 1)) if kn > 1 else nan
+    return (eq, bh, mean if k > 0 else nan, std, bh_std, neg_std, mdd, bh_mdd, trades, turnover_total, weight_sum)
+
+
+if njit is not None:
+    _backtest_kernel = njit(nogil=True)(_backtest_loop)
+else:
+    def _backtest_kernel(close, pos, fee_rate, start, ret, turnover, strategy_ret, equity, bh_equity):
+        # Même calcul en NumPy vectorisé, dans les buffers préalloués
+        np.divide(close[1:], close[:-1], out=ret[1:])
+        ret[1:] -= 1.0
+        ret[:1] = 0.0
+        np.nan_to_num(ret, copy=False, nan=0.0)
+        w = np.nan_to_num(pos, nan=0.0) / 100.0
+        turnover[:1] = np.abs(w[:1])
+        np.abs(np.diff(w), out=turnover[1:])
+        np.multiply(w, ret, out=strategy_ret)
+        strategy_ret -= turnover * fee_rate
+        np.cumprod(1.0 + strategy_ret, out=equity)
+        np.cumprod(1.0 + ret, out=bh_equity)
+        sr, r, eq, bh = strategy_ret[start:], ret[start:], equity[start:], bh_equity[start:]
+        neg = sr[sr < 0]
+        nan = math.nan
+        return (
+            equity[-1], bh_equity[-1],
+            sr.mean() if len(sr) else nan,
+            sr.std(ddof=1) if len(sr) > 1 else nan,
+            r.std(ddof=1) if len(r) > 1 else nan,
+            neg.std(ddof=1) if len(neg) > 1 else nan,
+            min((eq / np.maximum.accumulate(eq) - 1.0).min(initial=0.0), 0.0),
+            min((bh / np.maximum.accumulate(bh) - 1.0).min(initial=0.0), 0.0),
+            float((turnover[start:] > 1e-6).sum()), turnover.sum(), w.sum(),
+        )
+
+
+def _backtest_batch_loop(close, pos, fee_rate, start, out):
+    # Buffers d'une seule ligne, réutilisés : aucune courbe d'equity conservée
+    bufs = np.empty((5, close.shape[0]))
+    for r in range(pos.shape[0]):
+        stats = _backtest_kernel(close, pos[r], fee_rate, start, bufs[0], bufs[1], bufs[2], bufs[3], bufs[4])
+        for j in range(len(stats)):
+            out[r, j] = stats[j]
+
+
+if njit is not None:
+    _backtest_batch_kernel = njit(nogil=True)(_backtest_batch_loop)
+else:
+    def _backtest_batch_kernel(close, pos, fee_rate, start, out):
+        # Vectorisé sur les lignes du bloc (configs × jours)
+        ret = np.zeros(close.shape[0])
+        ret[1:] = close[1:] / close[:-1] - 1.0
+        np.nan_to_num(ret, copy=False, nan=0.0)
+        w = np.nan_to_num(pos, nan=0.0) / 100.0
+        turnover = np.abs(np.diff(w, axis=1, prepend=0.0))
+        sr = w * ret - turnover * fee_rate
+        equity = np.cumprod(1.0 + sr, axis=1)
+        bh = np.cumprod(1.0 + ret)
+        sr_s, r_s, eq_s, bh_s = sr[:, start:], ret[start:], equity[:, start:], bh[start:]
+        k = sr_s.shape[1]
+        neg = sr_s < 0
+        kn = neg.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            neg_mean = np.where(neg, sr_s, 0.0).sum(axis=1) / kn
+            neg_var = np.where(neg, (sr_s - neg_mean[:, None]) ** 2, 0.0).sum(axis=1) / (kn - 1)
+        out[:, 0] = equity[:, -1]
+        out[:, 1] = bh[-1]
+        out[:, 2] = sr_s.mean(axis=1) if k else np.nan
+        out[:, 3] = sr_s.std(axis=1, ddof=1) if k > 1 else np.nan
+        out[:, 4] = r_s.std(ddof=1) if k > 1 else np.nan
+        out[:, 5] = np.where(kn > 1, np.sqrt(neg_var), np.nan)
+        out[:, 6] = np.minimum((eq_s / np.maximum.accumulate(eq_s, axis=1) - 1.0).min(axis=1, initial=0.0), 0.0)
+        out[:, 7] = min((bh_s / np.maximum.accumulate(bh_s) - 1.0).min(initial=0.0), 0.0)
+        out[:, 8] = (turnover[:, start:] > 1e-6).sum(axis=1)
+        out[:, 9] = turnover.sum(axis=1)
+        out[:, 10] = w.sum(axis=1)
+
+
+def _metrics_from_stats(stats: dict, n: int, start: int) -> dict:
+    """Statistiques du noyau → métriques (scalaires ou tableaux, une valeur par config)."""
+    days = max(n - start, 1)
+    eq, bh, mdd = stats["EquityFinal"], stats["BHEquityFinal"], stats["MaxDD"]
+    with np.errstate(invalid="ignore"):
+        cagr = np.float64(eq) ** (ANN / days) - 1
+        bh_cagr = np.float64(bh) ** (ANN / days) - 1
+    vol = stats["std"] * np.sqrt(ANN)
+    mean = stats["mean"] * ANN
+    return {
+        "EquityFinal": eq,
+        "BHEquityFinal": bh,
+        "CAGR": cagr,
+        "BHCAGR": bh_cagr,
+        "Vol": vol,
+        "BHVol": stats["bh_std"] * np.sqrt(ANN),
+        "MaxDD": mdd,
+        "BHMaxDD": stats["BHMaxDD"],
+        "Sharpe": mean / (vol + 1e-12),
+        "Sortino": mean / (stats["neg_std"] * np.sqrt(ANN) + 1e-12),
+        "Calmar": cagr / (np.abs(mdd) + 1e-12),
+        "Days": days,
+        "trades": stats["trades"],
+        "turnover_total": stats["turnover_total"],
+        "avg_allocation": stats["weight_sum"] / n * 100,
+    }
+
+
+def backtest_arrays(close, pos, fees_bps: float = 10.0, start: int = 0, buffers: dict | None = None) -> dict:
+    """
+    Noyau fusionné : rendements, turnover, frais, equity, drawdown et métriques en une passe
 
     Args:
-        df: DataFrame avec colonnes 'close', 'pos' (allocation en %)
-        fees_bps: Frais de transaction en basis points (10 bps = 0.1%)
+        close: prix de clôture (n jours)
+        pos: allocation en % (n jours)
+        start: les métriques ne portent que sur les jours [start:] ; l'equity reste
+               cumulée depuis le jour 0 (utilisé par le walk-forward)
+        buffers: dict rempli avec les séries journalières (ret, turnover,
+                 strategy_ret, equity, bh_equity) si fourni
 
     Returns:
-        dict avec 'df' (résultats jour par jour) et 'metrics' (métriques de performance)
+        Métriques (mêmes clés et valeurs que `run_backtest`)
     """
-    d = df.copy()
+    close = np.ascontiguousarray(close, dtype=float)
+    pos = np.ascontiguousarray(pos, dtype=float)
+    n = close.shape[0]
+    if n == 0:
+        raise ValueError("Backtest sur une série vide.")
+    bufs = np.empty((5, n))
+    stats = dict(zip(_STATS, _backtest_kernel(close, pos, fees_bps / 10_000.0, int(start), *bufs)))
+    if buffers is not None:
+        buffers.update(zip(("ret", "turnover", "strategy_ret", "equity", "bh_equity"), bufs))
+
+    metrics = _metrics_from_stats(stats, n, start)
+    return {k: int(v) if k in ("Days", "trades") else float(v) for k, v in metrics.items()}
+
+
+def _iter_row_chunks(pos_matrix, n_days: int, chunk_rows: int | None, max_chunk_mb: float):
+    if not isinstance(pos_matrix, np.ndarray):  # itérable de blocs (ex: générateur)
+        for chunk in pos_matrix:
+            yield np.atleast_2d(np.asarray(chunk, dtype=float))
+        return
+    pos_matrix = np.atleast_2d(pos_matrix)
+    if chunk_rows is None:
+        # ~6 matrices temporaires (configs × jours) par bloc dans la version NumPy
+        chunk_rows = int(max_chunk_mb * 2**20 // (6 * 8 * max(n_days, 1)))
+    chunk_rows = max(1, chunk_rows)
+    for i in range(0, pos_matrix.shape[0], chunk_rows):
+        yield np.asarray(pos_matrix[i:i + chunk_rows], dtype=float)
 
-    # Calcul des rendements quotidiens
-    d["ret"] = d["close"].pct_change().fillna(0.0)
 
-    # Conversion des frais de bps en fraction
-    fee_rate = fees_bps / 10_000.0
+def run_backtest_batch(
+    close,
+    pos_matrix: np.ndarray | Iterable[np.ndarray],
+    fees_bps: float = 10.0,
+    start: int = 0,
+    chunk_rows: int | None = None,
+    max_chunk_mb: float = 256.0,
+) -> pd.DataFrame:
+    """
+    Backtest de N configs à la fois : positions (configs × jours) → une ligne de métriques par config
 
-    # Poids de l'allocation (0-100% → 0-1)
-    weight = d["pos"].fillna(0.0) / 100.0
+    Les lignes sont traitées par blocs de taille bornée (`chunk_rows`, sinon déduit
+    de `max_chunk_mb`) : seules les métriques sont conservées, jamais les courbes
+    d'equity. `pos_matrix` peut aussi être un itérable de blocs (configs × jours),
+    par exemple un générateur, pour ne jamais matérialiser la grille entière.
 
-    # Turnover = changement absolu du poids
-    # C'est le volume traité (achats + ventes)
-    turnover = weight.diff().abs().fillna(weight.abs())
+    Returns:
+        DataFrame (N lignes) avec les colonnes de `backtest_arrays`, mêmes valeurs
+    """
+    close = np.ascontiguousarray(close, dtype=float)
+    n = close.shape[0]
+    if n == 0:
+        raise ValueError("Backtest sur une série vide.")
+    parts = []
+    for chunk in _iter_row_chunks(pos_matrix, n, chunk_rows, max_chunk_mb):
+        if chunk.shape[1] != n:
+            raise ValueError(f"Positions sur {chunk.shape[1]} jours pour {n} prix.")
+        out = np.empty((chunk.shape[0], len(_STATS)))
+        _backtest_batch_kernel(close, np.ascontiguousarray(chunk), fees_bps / 10_000.0, int(start), out)
+        parts.append(out)
+    stats = np.concatenate(parts) if parts else np.empty((0, len(_STATS)))
+    metrics = pd.DataFrame(_metrics_from_stats(dict(zip(_STATS, stats.T)), n, start))
+    return metrics.astype({"Days": int, "trades": int})
 
-    # Rendement de la stratégie = rendement pondéré - frais
-    d["turnover"] = turnover
-    d["strategy_ret"] = weight * d["ret"] - turnover * fee_rate
 
-    # Equity curves (cumulées)
-    d["equity"] = (1 + d["strategy_ret"]).cumprod()
-    d["bh_equity"] = (1 + d["ret"]).cumprod()
+def run_backtest(
+    df: pd.DataFrame,
+    fees_bps: float = 10.0,
+    daily: bool = True,
+    max_gap_days: int | None = DEFAULT_MAX_GAP_DAYS,
+) -> dict:
+    """
+    Backtest long-only avec allocation variable
 
-    # Nombre de trades
-    d["trade"] = (turnover > 1e-6).astype(int)
+    Si `df` a une colonne 'date', les prix passent d'abord par `quality_gate` :
+    une date dupliquée, un close manquant (NaN) ou un trou > `max_gap_days` lève
+    ValueError (auparavant un NaN était toléré et propagé dans les rendements).
+    Combler d'abord avec `fill_gaps`, ou passer `max_gap_days=None`.
 
-    # Calcul des métriques de performance
-    metrics = compute_metrics(d)
-    metrics["trades"] = int(d["trade"].sum())
-    metrics["turnover_total"] = float(turnover.sum())
-    metrics["avg_allocation"] = float(weight.mean() * 100)
+    Args:
+        df: DataFrame avec colonnes 'close', 'pos' (allocation en %)
+        fees_bps: Frais de transaction en basis points (10 bps = 0.1%)
+        daily: si False, seules les métriques sont calculées ('df' vaut None)
+        max_gap_days: seuil du contrôle qualité des prix ; None le désactive
+
+    Returns:
+        dict avec 'df' (résultats jour par jour) et 'metrics' (métriques de performance)
+    """
+    if max_gap_days is not None and "date" in df:
+        quality_gate(df, max_gap_days=max_gap_days, cols=("close",))
+    buffers = {} if daily else None
+    metrics = backtest_arrays(df["close"].to_numpy(), df["pos"].to_numpy(), fees_bps, buffers=buffers)
+    if not daily:
+        return {"df": None, "metrics": metrics}
+
+    # DataFrame jour par jour, construit depuis les buffers du noyau
+    d = df.copy()
+    d["ret"] = buffers["ret"]
+    d["turnover"] = buffers["turnover"]
+    d["strategy_ret"] = buffers["strategy_ret"]
+    d["equity"] = buffers["equity"]
+    d["bh_equity"] = buffers["bh_equity"]
+    d["trade"] = (buffers["turnover"] > 1e-6).astype(int)
 
     return {
         "df": d,
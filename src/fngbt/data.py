@@ -1,34 +1,412 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import warnings
+from concurrent.futures import Future, wait
 from pathlib import Path
 from typing import Literal
 
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 
-def load_fng_alt() -> pd.DataFrame:
-    """Alternative.me Fear & Greed — timestamps UNIX (secs) -> daily date (naïf)."""
-    r = requests.get("https://api.alternative.me/fng/", params={"limit": 0, "format": "json"}, timeout=30)
-    r.raise_for_status()
-    js = r.json()["data"]
+# Cache local persistant (Parquet si pyarrow est dispo, sinon pickle)
+DEFAULT_CACHE_DIR = Path(os.environ.get("FNGBT_CACHE_DIR", Path.home() / ".cache" / "fngbt"))
+
+try:  # pragma: no cover - dépend de l'environnement
+    import pyarrow  # noqa: F401
+    _CACHE_SUFFIX = ".parquet"
+except ImportError:  # pragma: no cover
+    _CACHE_SUFFIX = ".pkl"
+
+
+def _cache_path(cache_dir: str | Path, name: str) -> Path:
+    return Path(cache_dir) / f"{name}{_CACHE_SUFFIX}"
+
+
+def _read_cache(path: Path) -> pd.DataFrame | None:
+    if not path.exists():
+        return None
+    try:
+        df = pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_pickle(path)
+    except Exception as exc:  # cache corrompu → on le réécrira
+        warnings.warn(f"Cache illisible ignoré ({path}): {exc}")
+        return None
+    return df if not df.empty else None
+
+
+def _write_cache(df: pd.DataFrame, path: Path) -> None:
+    """Écriture atomique (fichier temporaire puis rename) pour les accès concurrents."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    if path.suffix == ".parquet":
+        df.to_parquet(tmp, index=False)
+    else:
+        df.to_pickle(tmp)
+    os.replace(tmp, path)
+
+
+def _combine_daily(cached: pd.DataFrame | None, fresh: pd.DataFrame) -> pd.DataFrame:
+    """Concatène historique + nouvelles lignes ; les valeurs fraîches remplacent les anciennes."""
+    if cached is None:
+        return fresh
+    out = pd.concat([cached, fresh], ignore_index=True)
+    return out.drop_duplicates("date", keep="last").sort_values("date").reset_index(drop=True)
+
+
+def _fetch_fng(limit: int) -> pd.DataFrame:
+    js = _get_json(_get_session(), "https://api.alternative.me/fng/", {"limit": limit, "format": "json"})["data"]
     df = pd.DataFrame(js)
     dt = pd.to_datetime(df["timestamp"].astype("int64"), unit="s", utc=True).dt.normalize().dt.tz_localize(None)
     out = pd.DataFrame({"date": dt, "fng": pd.to_numeric(df["value"], errors="coerce")})
     return out.dropna().drop_duplicates("date").sort_values("date").reset_index(drop=True)
 
+
+def load_fng_alt(cache_dir: str | Path | None = DEFAULT_CACHE_DIR, offline: bool = False) -> pd.DataFrame:
+    """
+    Alternative.me Fear & Greed — timestamps UNIX (secs) -> daily date (naïf).
+
+    Parameters
+    ----------
+    cache_dir : str | Path | None
+        Dossier du cache local. Seuls les jours manquants en fin d'historique sont
+        re-téléchargés. ``None`` désactive le cache (téléchargement complet).
+    offline : bool
+        Si True, lit uniquement le cache (aucun appel réseau) ; exige `cache_dir`.
+    """
+    if cache_dir is None:
+        if offline:
+            raise RuntimeError("Mode offline : aucun dossier de cache (cache_dir=None).")
+        return _fetch_fng(limit=0)
+
+    path = _cache_path(cache_dir, "fng")
+    cached = _read_cache(path)
+    if offline:
+        if cached is None:
+            raise RuntimeError(f"Mode offline : aucun cache FNG dans {cache_dir}.")
+        return cached
+
+    today = _today_utc()
+    if cached is not None and cached["date"].max() >= today:
+        return cached
+
+    # limit=0 → tout l'historique ; sinon on re-télécharge la queue (+ recouvrement)
+    limit = 0 if cached is None else int((today - cached["date"].max()).days) + 2
+    try:
+        fresh = _fetch_fng(limit=limit)
+    except (requests.RequestException, ValueError, KeyError) as exc:
+        if cached is None:
+            raise
+        warnings.warn(f"FNG indisponible ({exc}) → utilisation du cache local.")
+        return cached
+
+    out = _combine_daily(cached, fresh)
+    _write_cache(out, path)
+    return out
+
+# Premier jour de l'historique BTC-USD chez CoinGecko (rien à télécharger avant)
+_COINGECKO_FIRST_DAY = pd.Timestamp("2013-04-28")
+
+
+def _today_utc() -> pd.Timestamp:
+    """Date du jour (UTC), naïve."""
+    return pd.Timestamp.now(tz="UTC").normalize().tz_localize(None)
+
+
 def _to_utc_timestamp(dt) -> int:
     ts = pd.to_datetime(dt, utc=True)
     return int(ts.timestamp())
 
 
-def _load_prices_from_csv(csv_path: Path) -> pd.DataFrame:
-    df = pd.read_csv(csv_path)
-    if not {"date", "close"}.issubset(df.columns):
+
+def _daily_partial(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Agrège un bloc de lignes (intraday ou journalières) en OHLC par jour UTC."""
+    ts = pd.to_datetime(chunk["date"], utc=True, errors="coerce")
+    close = pd.to_numeric(chunk["close"], errors="coerce")
+    cols = {"day": ts.dt.normalize().dt.tz_localize(None), "ts": ts, "close": close}
+    for c in ("open", "high", "low"):
+        cols[c] = pd.to_numeric(chunk[c], errors="coerce") if c in chunk else close
+    d = pd.DataFrame(cols).dropna(subset=["ts", "close"])
+    # Horodatage dupliqué : la première ligne du fichier l'emporte (règle historique)
+    d = d.drop_duplicates("ts", keep="first").sort_values("ts", kind="stable")
+    g = d.groupby("day", sort=True)
+    return pd.DataFrame({
+        "first_ts": g["ts"].first(),
+        "open": g["open"].first(),
+        "last_ts": g["ts"].last(),
+        "close": g["close"].last(),
+        "high": g["high"].max(),
+        "low": g["low"].min(),
+    })
+
+
+def _merge_partials(acc: pd.DataFrame | None, part: pd.DataFrame) -> pd.DataFrame:
+    """Fusionne deux agrégats journaliers (un jour peut chevaucher deux blocs)."""
+    if acc is None:
+        return part
+    both = pd.concat([acc, part])
+    first = both.sort_values("first_ts", kind="stable").groupby(level=0)[["first_ts", "open"]].first()
+    # À horodatage égal, le bloc le plus ancien (`acc`) l'emporte : concat inversé
+    last = (
+        pd.concat([part, acc])
+        .sort_values("last_ts", kind="stable")
+        .groupby(level=0)[["last_ts", "close"]]
+        .last()
+    )
+    hl = both.groupby(level=0).agg(high=("high", "max"), low=("low", "min"))
+    return pd.concat([first, last, hl], axis=1)
+
+
+# Taille d'un bloc lu par le moteur pyarrow en streaming
+_ARROW_BLOCK_SIZE = 64 << 20
+
+
+def _iter_csv_chunks(csv_path: Path, chunk_rows: int):
+    """Lecture par blocs : moteur pyarrow en streaming si disponible, sinon pandas (C)."""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    if not {"date", "close"}.issubset(header):
         raise ValueError("Le fichier CSV doit contenir les colonnes 'date' et 'close'.")
-    df["date"] = pd.to_datetime(df["date"], utc=True, errors="coerce").dt.tz_localize(None)
-    df["close"] = pd.to_numeric(df["close"], errors="coerce")
-    return df.dropna(subset=["date", "close"]).drop_duplicates("date").sort_values("date").reset_index(drop=True)
+    usecols = [c for c in header if c in ("date", "open", "high", "low", "close")]
+    try:
+        from pyarrow import csv as pa_csv
+        import pyarrow as pa
+    except ImportError:
+        pa_csv = None
+
+    if pa_csv is not None:
+        # Types fixés : inférés sur le premier bloc, des prix entiers en tête de fichier
+        # feraient échouer un bloc suivant contenant des décimales
+        types = {c: pa.float64() for c in usecols if c != "date"}
+        reader = pa_csv.open_csv(
+            csv_path,
+            read_options=pa_csv.ReadOptions(block_size=_ARROW_BLOCK_SIZE),
+            convert_options=pa_csv.ConvertOptions(include_columns=usecols, column_types={"date": pa.string(), **types}),
+        )
+        for batch in reader:
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(csv_path, usecols=usecols, dtype={"date": str}, chunksize=chunk_rows)
+
+
+def read_price_csv(csv_path: str | Path, ohlc: bool = False, chunk_rows: int = 1_000_000) -> pd.DataFrame:
+    """
+    Lit un CSV de prix (journalier ou intraday, éventuellement de plusieurs Go) par blocs
+    et l'agrège au fil de l'eau en clôture journalière UTC (dernier prix du jour).
+
+    La mémoire reste bornée par la taille d'un bloc + le nombre de jours.
+    Une ligne dont l'horodatage est dupliqué est ignorée : la première du fichier
+    l'emporte, comme avant l'agrégation journalière.
+
+    Args:
+        csv_path: CSV avec au moins `date` et `close` (+ `open`, `high`, `low` optionnels)
+        ohlc: si True, renvoie aussi open/high/low journaliers
+        chunk_rows: nombre de lignes par bloc (moteur pandas)
+    """
+    acc = None
+    for chunk in _iter_csv_chunks(Path(csv_path), chunk_rows):
+        acc = _merge_partials(acc, _daily_partial(chunk))
+    cols = ["open", "high", "low", "close"] if ohlc else ["close"]
+    if acc is None:
+        return pd.DataFrame(columns=["date", *cols])
+    return acc.sort_index()[cols].rename_axis("date").reset_index()
+
+
+def _load_prices_from_csv(csv_path: Path) -> pd.DataFrame:
+    return read_price_csv(csv_path)
+
+
+COINGECKO_RANGE_URL = "https://api.coingecko.com/api/v3/coins/bitcoin/market_chart/range"
+
+# CoinGecko renvoie une granularité journalière seulement au-delà de 90 jours
+_MIN_WINDOW_DAYS = 91
+
+_SESSION: requests.Session | None = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _get_session(pool_size: int = 8) -> requests.Session:
+    """Session HTTP partagée (keep-alive + pool de connexions)."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSION = session
+        return _SESSION
+
+
+def _get_json(session: requests.Session, url: str, params: dict, retries: int = 4, backoff: float = 1.0, timeout: float = 30):
+    """GET avec retry exponentiel ; respecte `Retry-After` sur 429/5xx."""
+    for attempt in range(retries + 1):
+        try:
+            resp = session.get(url, params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+        else:
+            if resp.status_code != 429 and resp.status_code < 500:
+                resp.raise_for_status()
+                return resp.json()
+            if attempt == retries:
+                resp.raise_for_status()
+            retry_after = resp.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.isdigit() else backoff * 2 ** attempt
+        time.sleep(delay)
+
+
+def _start_daemon(name: str, fn, **kwargs) -> Future:
+    """Lance `fn` dans un thread daemon : un appel hors délai ne bloque pas la sortie du process."""
+    fut: Future = Future()
+
+    def _run():
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            fut.set_result(fn(**kwargs))
+        except BaseException as exc:
+            fut.set_exception(exc)
+
+    threading.Thread(target=_run, name=f"fngbt-{name}", daemon=True).start()
+    return fut
+
+
+def _daemon_map(fn, items, max_workers: int, name: str) -> list:
+    """`map` parallèle (ordre conservé) sur des threads daemon ; la première erreur est relancée."""
+    items = list(items)
+    out: list = [None] * len(items)
+    todo = iter(enumerate(items))
+    lock = threading.Lock()
+    failed = threading.Event()
+
+    def _worker():
+        while not failed.is_set():
+            with lock:
+                nxt = next(todo, None)
+            if nxt is None:
+                return
+            try:
+                out[nxt[0]] = fn(nxt[1])
+            except BaseException:
+                failed.set()
+                raise
+
+    n = max(1, min(max_workers, len(items)))
+    for fut in [_start_daemon(f"{name}-{k}", _worker) for k in range(n)]:
+        fut.result()
+    return out
+
+
+def _date_windows(start_dt: pd.Timestamp, end_dt: pd.Timestamp, window_days: int) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Découpe [start, end] en fenêtres contiguës d'au moins 91 jours.
+
+    Un intervalle plus court est élargi vers le passé (`end - 91 jours`) : en dessous,
+    CoinGecko renvoie des points horaires (voire 5 minutes) au lieu de clôtures journalières.
+    """
+    min_window = pd.Timedelta(days=_MIN_WINDOW_DAYS)
+    start_dt = min(start_dt, end_dt - min_window)
+    window = pd.Timedelta(days=max(int(window_days), _MIN_WINDOW_DAYS))
+    bounds = [start_dt]
+    while bounds[-1] + window < end_dt:
+        bounds.append(bounds[-1] + window)
+    # Dernière fenêtre trop courte → fusion avec la précédente
+    if len(bounds) > 1 and end_dt - bounds[-1] < min_window:
+        bounds.pop()
+    bounds.append(end_dt)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def download_btc_prices(
+    start,
+    end,
+    url: str = COINGECKO_RANGE_URL,
+    window_days: int = 365,
+    max_workers: int = 4,
+    retries: int = 4,
+    backoff: float = 1.0,
+) -> pd.DataFrame:
+    """
+    Téléchargement CoinGecko par fenêtres, en parallèle sur une session partagée.
+
+    Chaque fenêtre est retentée avec backoff exponentiel (429 / 5xx / timeout),
+    puis les fenêtres sont recollées et dédoublonnées (un prix par jour).
+    """
+    start_dt = pd.to_datetime(start).tz_localize(None)
+    end_dt = pd.to_datetime(end).tz_localize(None)
+    windows = _date_windows(start_dt, end_dt, window_days)
+    session = _get_session(pool_size=max(max_workers, 1))
+
+    def _fetch(window: tuple[pd.Timestamp, pd.Timestamp]) -> list:
+        params = {
+            "vs_currency": "usd",
+            "from": _to_utc_timestamp(window[0]),
+            "to": _to_utc_timestamp(window[1]),
+        }
+        return _get_json(session, url, params, retries=retries, backoff=backoff).get("prices", [])
+
+    chunks = _daemon_map(_fetch, windows, max_workers, name="coingecko")
+
+    prices = [p for chunk in chunks for p in chunk]
+    if not prices:
+        raise RuntimeError("CoinGecko BTC-USD vide ou indisponible.")
+
+    df = pd.DataFrame(prices, columns=["timestamp_ms", "close"]).sort_values("timestamp_ms", kind="stable")
+    df["date"] = pd.to_datetime(df["timestamp_ms"], unit="ms", utc=True).dt.normalize().dt.tz_localize(None)
+    # Fenêtres courtes élargies vers le passé → on revient à l'intervalle demandé
+    out = df.loc[(df["date"] >= start_dt.normalize()) & (df["date"] <= end_dt), ["date", "close"]]
+    return out.dropna().drop_duplicates("date").sort_values("date").reset_index(drop=True)
+
+
+def _load_prices_cached(start_dt: pd.Timestamp, end_dt: pd.Timestamp, cache_dir: str | Path, offline: bool) -> pd.DataFrame:
+    """Complète le cache local uniquement sur les portions manquantes (tête et/ou queue)."""
+    path = _cache_path(cache_dir, "btc_usd")
+    cached = _read_cache(path)
+    if offline:
+        if cached is None:
+            raise RuntimeError(f"Mode offline : aucun cache de prix dans {cache_dir}.")
+        return cached
+
+    start_dt = max(start_dt, _COINGECKO_FIRST_DAY)
+    missing: list[tuple[pd.Timestamp, pd.Timestamp]] = []
+    if cached is None:
+        missing.append((start_dt, end_dt))
+    else:
+        first, last = cached["date"].min(), cached["date"].max()
+        if start_dt < first:
+            missing.append((start_dt, first))
+        # Le dernier jour en cache peut être un prix intraday → on le re-télécharge
+        if end_dt > last + pd.Timedelta(days=1):
+            missing.append((last, end_dt))
 
+    out = cached
+    try:
+        for lo, hi in missing:
+            out = _combine_daily(out, download_btc_prices(lo, hi))
+    except (requests.RequestException, RuntimeError, ValueError) as exc:
+        if cached is None:
+            raise
+        warnings.warn(f"CoinGecko indisponible ({exc}) → utilisation du cache local.")
+        return cached
 
-def load_btc_prices(start=None, end=None, csv_path: str | Path | None = None) -> pd.DataFrame:
+    if missing:
+        _write_cache(out, path)
+    return out
+
+
+def load_btc_prices(
+    start=None,
+    end=None,
+    csv_path: str | Path | None = None,
+    cache_dir: str | Path | None = DEFAULT_CACHE_DIR,
+    offline: bool = False,
+) -> pd.DataFrame:
     """
     BTC-USD daily close fetched from CoinGecko (no yfinance dependency).
 
@@ -38,50 +416,305 @@ def load_btc_prices(start=None, end=None, csv_path: str | Path | None = None) ->
         Intervalle de dates (inclus, en timezone naïve).
     csv_path : str | Path, optional
         Si fourni, charge les prix depuis un CSV local (colonnes `date`, `close`).
+    cache_dir : str | Path | None
+        Dossier du cache local : seules les dates absentes du cache sont téléchargées.
+        ``None`` désactive le cache.
+    offline : bool
+        Si True, lit uniquement le cache (aucun appel réseau) ; exige `cache_dir`.
     """
 
-    start_dt = pd.to_datetime(start or "2013-01-01")
-    end_dt = pd.to_datetime(end) if end is not None else pd.Timestamp.utcnow().normalize() + pd.Timedelta(days=1)
+    start_dt = pd.to_datetime(start or "2013-01-01").tz_localize(None)
+    today_plus_one = _today_utc() + pd.Timedelta(days=1)
+    end_dt = pd.to_datetime(end).tz_localize(None) if end is not None else today_plus_one
 
     # CoinGecko ne retourne rien dans le futur → on borne à "demain"
-    today_plus_one = pd.Timestamp.utcnow().normalize() + pd.Timedelta(days=1)
     end_dt = min(end_dt, today_plus_one)
 
     if csv_path is not None:
         df = _load_prices_from_csv(Path(csv_path))
-        mask = (df["date"] >= start_dt.tz_localize(None)) & (df["date"] <= end_dt.tz_localize(None))
+        mask = (df["date"] >= start_dt) & (df["date"] <= end_dt)
         df = df.loc[mask].reset_index(drop=True)
         if df.empty:
             raise ValueError("Le CSV local ne couvre pas l'intervalle demandé.")
         return df
 
-    params = {
-        "vs_currency": "usd",
-        "from": _to_utc_timestamp(start_dt),
-        "to": _to_utc_timestamp(end_dt),
-    }
-
-    url = "https://api.coingecko.com/api/v3/coins/bitcoin/market_chart/range"
-    resp = requests.get(url, params=params, timeout=30)
-    resp.raise_for_status()
-    js = resp.json()
-    prices = js.get("prices", [])
-    if not prices:
-        raise RuntimeError("CoinGecko BTC-USD vide ou indisponible.")
+    if cache_dir is None:
+        if offline:
+            raise RuntimeError("Mode offline : aucun dossier de cache (cache_dir=None).")
+        return download_btc_prices(start_dt, end_dt)
 
-    df = pd.DataFrame(prices, columns=["timestamp_ms", "close"])
-    df["date"] = pd.to_datetime(df["timestamp_ms"], unit="ms", utc=True).dt.normalize().dt.tz_localize(None)
-    out = df[["date", "close"]]
-    return out.dropna().drop_duplicates("date").sort_values("date").reset_index(drop=True)
+    df = _load_prices_cached(start_dt, end_dt, cache_dir, offline)
+    mask = (df["date"] >= start_dt) & (df["date"] <= end_dt)
+    return df.loc[mask].reset_index(drop=True)
 
 def merge_daily(fng: pd.DataFrame, px: pd.DataFrame) -> pd.DataFrame:
     df = pd.merge(fng, px, on="date", how="inner").sort_values("date").reset_index(drop=True)
     return df
 
-def to_weekly(df: pd.DataFrame, how: Literal["last","mean"]="last") -> pd.DataFrame:
-    """Option hebdo : FNG agrégé et prix close de fin de semaine (ou moyenne)."""
-    g = df.set_index("date").resample("W-FRI")
-    f = g["fng"].mean() if how=="mean" else g["fng"].last()
+
+# Premier jour publié par alternative.me (inutile de charger des prix avant)
+FNG_FIRST_DAY = pd.Timestamp("2018-02-01")
+
+
+def load_all(
+    start=None,
+    end=None,
+    csv_path: str | Path | None = None,
+    cache_dir: str | Path | None = DEFAULT_CACHE_DIR,
+    timeout: float = 60.0,
+) -> pd.DataFrame:
+    """
+    Charge FNG et prix BTC en parallèle puis renvoie le DataFrame fusionné.
+
+    `timeout` est un budget global (secondes) pour les deux téléchargements.
+    Une source en échec ou hors délai se rabat sur le cache local
+    (ou sur `csv_path` pour les prix) sans nouvel appel réseau ; sans source
+    de secours (`cache_dir=None` et pas de CSV), une RuntimeError est levée.
+    """
+    start = start or FNG_FIRST_DAY
+    deadline = time.monotonic() + timeout
+    # Threads daemon : un téléchargement hors délai continue en arrière-plan
+    # (écriture du cache) sans retenir l'interpréteur à la sortie
+    fut_fng = _start_daemon("fng", load_fng_alt, cache_dir=cache_dir)
+    fut_px = _start_daemon("prices", load_btc_prices, start=start, end=end, cache_dir=cache_dir)
+    wait([fut_fng, fut_px], timeout=max(0.0, deadline - time.monotonic()))
+
+    def _result_or_fallback(fut, name: str, fallback):
+        if fut.done() and fut.exception() is None:
+            return fut.result()
+        reason = fut.exception() if fut.done() else "délai dépassé"
+        warnings.warn(f"{name} indisponible ({reason}) → source de secours.")
+        try:
+            return fallback()
+        except (RuntimeError, ValueError, OSError) as exc:
+            raise RuntimeError(f"{name} indisponible ({reason}) et aucune source de secours ({exc}).") from exc
+
+    fng = _result_or_fallback(fut_fng, "FNG", lambda: load_fng_alt(cache_dir=cache_dir, offline=True))
+
+    def _px_fallback():
+        if csv_path is not None:
+            return load_btc_prices(start=start, end=end, csv_path=csv_path)
+        return load_btc_prices(start=start, end=end, cache_dir=cache_dir, offline=True)
+
+    px = _result_or_fallback(fut_px, "Prix BTC", _px_fallback)
+    return merge_daily(fng, px)
+
+
+SNAPSHOT_FORMAT = 1
+
+
+def _snapshot_version(df: pd.DataFrame) -> str:
+    h = hashlib.sha1()
+    for col in df.columns:
+        h.update(col.encode())
+        h.update(np.ascontiguousarray(df[col].to_numpy()).tobytes())
+    return h.hexdigest()[:12]
+
+
+def _prune_snapshots(root: Path, keep: int) -> None:
+    """Supprime les versions les plus anciennes (date de `meta.json`) au-delà des `keep` dernières."""
+    versions = [p for p in root.iterdir() if p.is_dir() and not p.name.startswith(".") and (p / "meta.json").exists()]
+    versions.sort(key=lambda p: (p / "meta.json").stat().st_mtime, reverse=True)
+    for old in versions[max(keep, 1):]:
+        # Un process qui a déjà mappé ces fichiers garde ses pages (unlink POSIX)
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def write_snapshot(df: pd.DataFrame, root: str | Path = DEFAULT_CACHE_DIR / "snapshots", keep: int = 3) -> Path:
+    """
+    Écrit le DataFrame fusionné en snapshot colonnaire versionné (un `.npy` par colonne).
+
+    La version est une empreinte du contenu : un même dataset réécrit la même version.
+    Le fichier `LATEST` pointe vers le dernier snapshot écrit ; seules les `keep`
+    versions les plus récentes sont conservées (l'espace disque ne croît pas à
+    chaque rafraîchissement des données).
+    """
+    bad = [c for c in df.columns if not (pd.api.types.is_numeric_dtype(df[c]) or pd.api.types.is_datetime64_dtype(df[c]))]
+    if bad:
+        raise ValueError(f"Colonnes non numériques non supportées dans un snapshot: {bad}")
+
+    root = Path(root)
+    version = _snapshot_version(df)
+    target = root / version
+    if not target.exists():
+        tmp = root / f".{version}.{os.getpid()}.tmp"
+        tmp.mkdir(parents=True, exist_ok=True)
+        for col in df.columns:
+            np.save(tmp / f"{col}.npy", np.ascontiguousarray(df[col].to_numpy()))
+        meta = {"format": SNAPSHOT_FORMAT, "version": version, "rows": len(df), "columns": list(df.columns)}
+        (tmp / "meta.json").write_text(json.dumps(meta))
+        try:
+            os.replace(tmp, target)
+        except OSError:  # écrit entre-temps par un autre process
+            shutil.rmtree(tmp, ignore_errors=True)
+    else:
+        os.utime(target / "meta.json")  # version réécrite → redevient la plus récente
+    latest = root / f".LATEST.{os.getpid()}.tmp"
+    latest.write_text(version)
+    os.replace(latest, root / "LATEST")
+    _prune_snapshots(root, keep)
+    return target
+
+
+def load_snapshot(root: str | Path = DEFAULT_CACHE_DIR / "snapshots", version: str | None = None, mmap: bool = True) -> pd.DataFrame:
+    """
+    Charge un snapshot colonnaire. Avec `mmap=True`, les colonnes sont des vues
+    `np.memmap` en lecture seule : tous les process partagent les mêmes pages
+    physiques et le chargement ne lit pas les données.
+    """
+    root = Path(root)
+    version = version or (root / "LATEST").read_text().strip()
+    path = root / version
+    meta = json.loads((path / "meta.json").read_text())
+    if meta.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Format de snapshot non supporté: {meta.get('format')}")
+    mode = "r" if mmap else None
+    cols = {c: np.load(path / f"{c}.npy", mmap_mode=mode) for c in meta["columns"]}
+    return pd.DataFrame(cols, copy=False)
+
+
+FngAgg = Literal["last", "mean", "median", "min", "max"]
+
+# Fin de mois : "ME" depuis pandas 2.2 ("M" y est déprécié puis refusé), "M" avant
+_MONTH_END = "ME" if tuple(int(x) for x in pd.__version__.split(".")[:2]) >= (2, 2) else "M"
+_FREQ_ALIASES = {"M": _MONTH_END, "1M": _MONTH_END, "ME": _MONTH_END}
+
+
+def resample(df: pd.DataFrame, freq: str = "W-FRI", fng_how: FngAgg = "last") -> pd.DataFrame:
+    """
+    Ré-échantillonne le DataFrame journalier : FNG agrégé selon `fng_how`,
+    close de fin de période.
+
+    `freq` : "D", "3D", "W-MON" ... "W-SUN", "M" (fin de mois), ou tout alias pandas.
+    Chaque période est fermée et datée à droite (fin de période) quelle que soit la
+    fréquence : une ligne ne porte jamais un close observé après sa date.
+    """
+    freq = _FREQ_ALIASES.get(freq, freq)
+    if freq == "D":
+        return df[["date", "fng", "close"]].dropna().reset_index(drop=True)
+    g = df.set_index("date").resample(freq, label="right", closed="right")
+    f = getattr(g["fng"], fng_how)()
     c = g["close"].last()
     out = pd.DataFrame({"date": f.index, "fng": f.values, "close": c.values}).dropna().reset_index(drop=True)
     return out
+
+
+def to_weekly(df: pd.DataFrame, how: Literal["last","mean"]="last") -> pd.DataFrame:
+    """Option hebdo : FNG agrégé et prix close de fin de semaine (ou moyenne)."""
+    return resample(df, "W-FRI", fng_how=how)
+
+
+class ResamplePyramid:
+    """
+    Pyramide de résolutions construite à partir d'un même DataFrame journalier.
+
+    Chaque niveau (fréquence, agrégation FNG) est calculé au premier accès puis
+    gardé en mémoire : changer de résolution dans une optimisation ne recalcule rien.
+
+    >>> pyr = ResamplePyramid(df)
+    >>> weekly = pyr.get("W-FRI")
+    >>> monthly = pyr.get("M", fng_how="mean")
+    """
+
+    DEFAULT_LEVELS = ("D", "3D", "W-FRI", "M")
+
+    def __init__(self, daily: pd.DataFrame):
+        self.daily = daily.sort_values("date").reset_index(drop=True)
+        self._levels: dict[tuple[str, str], pd.DataFrame] = {}
+
+    def get(self, freq: str = "W-FRI", fng_how: FngAgg = "last") -> pd.DataFrame:
+        key = (_FREQ_ALIASES.get(freq, freq), fng_how)
+        if key not in self._levels:
+            self._levels[key] = resample(self.daily, key[0], fng_how=fng_how)
+        return self._levels[key]
+
+    def build(self, levels: tuple[str, ...] = DEFAULT_LEVELS, fng_how: FngAgg = "last") -> dict[str, pd.DataFrame]:
+        """Pré-calcule plusieurs niveaux d'un coup ; renvoie {fréquence: DataFrame}."""
+        return {freq: self.get(freq, fng_how) for freq in levels}
+
+
+def append_daily(
+    merged: pd.DataFrame,
+    fng_new: pd.DataFrame,
+    px_new: pd.DataFrame,
+    pending: pd.DataFrame | None = None,
+) -> tuple[pd.DataFrame, int, pd.DataFrame]:
+    """
+    Ajoute les nouvelles observations à un DataFrame déjà fusionné (sans refaire la jointure).
+
+    Seules les nouvelles lignes sont jointes ; une date déjà présente est remplacée.
+    Une date reçue d'un seul côté (FNG publié, prix pas encore) n'est pas perdue :
+    elle est renvoyée dans `pending`, à repasser à l'appel suivant. Le résultat
+    reste ainsi identique à un `merge_daily` complet de toutes les données reçues.
+
+    Coût : la jointure et le tri ne portent que sur les nouvelles lignes, mais le
+    DataFrame renvoyé est un nouvel objet (`pd.concat`) : la copie des colonnes
+    reste O(historique) (de l'ordre de 10 ms pour dix ans de données journalières).
+
+    >>> df, first, pending = append_daily(df, fng_today, px_today, pending)
+
+    Returns
+    -------
+    (df, first_changed, pending) : `first_changed` est l'indice positionnel de la
+    première ligne ajoutée ou modifiée (`len(df)` si rien n'a changé) ; `pending`
+    contient les dates encore incomplètes (colonne manquante à NaN).
+    """
+    fng_cols = [c for c in fng_new.columns if c != "date"]
+    px_cols = [c for c in px_new.columns if c != "date"]
+    dtypes = {**fng_new.dtypes[fng_cols].to_dict(), **px_new.dtypes[px_cols].to_dict()}
+    if pending is not None and not pending.empty:
+        fng_new = pd.concat([pending[["date", *fng_cols]].dropna(), fng_new], ignore_index=True)
+        px_new = pd.concat([pending[["date", *px_cols]].dropna(), px_new], ignore_index=True)
+    both = pd.merge(
+        fng_new.drop_duplicates("date", keep="last"),
+        px_new.drop_duplicates("date", keep="last"),
+        on="date",
+        how="outer",
+    ).sort_values("date").reset_index(drop=True)
+
+    # Correction d'un seul côté pour une date déjà fusionnée : l'autre côté vient de `merged`
+    if not both.empty and not merged.empty:
+        lo = int(merged["date"].searchsorted(both["date"].iloc[0], side="left"))
+        known = merged.iloc[lo:].set_index("date")
+        for col in (*fng_cols, *px_cols):
+            both[col] = both[col].fillna(both["date"].map(known[col]))
+
+    complete = both[[*fng_cols, *px_cols]].notna().all(axis=1)
+    new = both[complete].astype(dtypes).reset_index(drop=True)
+    pending = both[~complete].reset_index(drop=True)
+    if new.empty:
+        return merged, len(merged), pending
+    cut = int(merged["date"].searchsorted(new["date"].iloc[0], side="left"))
+    tail = pd.concat([merged.iloc[cut:], new], ignore_index=True)
+    tail = tail.drop_duplicates("date", keep="last").sort_values("date")
+    out = pd.concat([merged.iloc[:cut], tail], ignore_index=True)
+    return out, cut, pending
+
+
+def append_weekly(
+    weekly: pd.DataFrame,
+    daily: pd.DataFrame,
+    first_changed: int,
+    how: Literal["last","mean"]="last",
+) -> tuple[pd.DataFrame, int]:
+    """
+    Met à jour un DataFrame `to_weekly` après un `append_daily`.
+
+    Seules les semaines (W-FRI) touchées à partir de `daily.iloc[first_changed]`
+    sont ré-agrégées : en usage quotidien, uniquement la dernière semaine ouverte.
+    Comme pour `append_daily`, la concaténation finale copie l'historique hebdo (O(n)).
+
+    Returns
+    -------
+    (weekly, first_changed) : indice de la première semaine ajoutée ou modifiée.
+    """
+    if first_changed >= len(daily):
+        return weekly, len(weekly)
+    first_date = daily["date"].iloc[first_changed]
+    week_end = pd.offsets.Week(weekday=4).rollforward(first_date)  # vendredi >= first_date
+    week_start = week_end - pd.Timedelta(days=6)
+    lo = int(daily["date"].searchsorted(week_start, side="left"))
+    fresh = to_weekly(daily.iloc[lo:], how=how)
+    cut = int(weekly["date"].searchsorted(week_end, side="left"))
+    out = pd.concat([weekly.iloc[:cut], fresh], ignore_index=True)
+    return out, cut
@@ -0,0 +1,151 @@
+"""
+Registre d'indicateurs dérivés (DAG paresseux et mémoïsé)
+
+Chaque indicateur déclare ses entrées (colonnes brutes `date`, `fng`, `close`
+ou autres indicateurs). Il n'est calculé qu'à la première demande, puis gardé
+en cache par empreinte de dataset : une config ne déclenche que les
+indicateurs qu'elle lit réellement.
+
+Noms disponibles:
+- fng_ema{span}      : EMA du FNG (ex: fng_ema200), `ema200_soft` = fng_ema200
+- fng_sma{window}    : moyenne mobile simple du FNG
+- rainbow:{model}    : colonnes Rainbow du modèle (full, expanding, quantile)
+- rainbow_position   : position Rainbow (modèle full), ou rainbow_position:{model}
+"""
+from __future__ import annotations
+import hashlib
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Tuple
+
+import numpy as np
+import pandas as pd
+
+RAW_COLUMNS = ("date", "fng", "close")
+
+
+@dataclass(frozen=True)
+class Indicator:
+    """Nœud du DAG : nom, entrées déclarées et fonction de calcul"""
+    name: str
+    inputs: Tuple[str, ...]
+    func: Callable
+
+
+_REGISTRY: dict[str, Indicator] = {}
+_PATTERNS: list[tuple[re.Pattern, Callable[[re.Match], Indicator]]] = []
+
+# Cache global (empreinte du dataset, nom) → valeur, borné en LRU
+_CACHE: "OrderedDict[tuple[str, str], pd.Series | pd.DataFrame]" = OrderedDict()
+_CACHE_SIZE = 256
+
+
+def register(name: str, inputs: Tuple[str, ...]):
+    """Décorateur : enregistre un indicateur à nom fixe."""
+    def deco(func: Callable) -> Callable:
+        _REGISTRY[name] = Indicator(name, tuple(inputs), func)
+        return func
+    return deco
+
+
+def register_pattern(pattern: str, factory: Callable[[re.Match], Indicator]) -> None:
+    """Enregistre une famille d'indicateurs paramétrés (ex: `fng_ema(\\d+)`)."""
+    _PATTERNS.append((re.compile(pattern), factory))
+
+
+def resolve(name: str) -> Indicator:
+    if name in _REGISTRY:
+        return _REGISTRY[name]
+    for pattern, factory in _PATTERNS:
+        m = pattern.fullmatch(name)
+        if m:
+            return factory(m)
+    raise KeyError(f"Indicateur inconnu: {name}")
+
+
+def dataset_fingerprint(df: pd.DataFrame, cols=RAW_COLUMNS) -> str:
+    """Empreinte des colonnes brutes *et* de l'index (les indicateurs mis en cache le portent)."""
+    h = hashlib.sha1()
+    idx = df.index
+    if isinstance(idx, pd.RangeIndex):
+        h.update(f"range:{idx.start}:{idx.stop}:{idx.step}".encode())
+    else:
+        h.update(pd.util.hash_pandas_object(idx, index=False).to_numpy().tobytes())
+    for col in cols:
+        if col in df.columns:
+            h.update(col.encode())
+            h.update(np.ascontiguousarray(df[col].to_numpy()).tobytes())
+    return h.hexdigest()
+
+
+class IndicatorStore:
+    """
+    Accès paresseux aux indicateurs d'un dataset
+
+    Une colonne déjà présente dans le DataFrame est utilisée telle quelle ;
+    sinon l'indicateur (et ses entrées) est calculé puis mémoïsé.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.fingerprint = dataset_fingerprint(df)
+
+    def __contains__(self, name: str) -> bool:
+        return (self.fingerprint, name) in _CACHE
+
+    def get(self, name: str) -> pd.Series | pd.DataFrame:
+        if name in self.df.columns:
+            return self.df[name]
+        key = (self.fingerprint, name)
+        if key in _CACHE:
+            _CACHE.move_to_end(key)
+            return _CACHE[key]
+        ind = resolve(name)
+        value = ind.func(*(self.get(i) for i in ind.inputs))
+        _CACHE[key] = value
+        if len(_CACHE) > _CACHE_SIZE:
+            _CACHE.popitem(last=False)
+        return value
+
+
+def clear_cache() -> None:
+    _CACHE.clear()
+
+
+# ---------------------------------------------------------------------------
+# Indicateurs FNG
+# ---------------------------------------------------------------------------
+
+register_pattern(
+    r"fng_ema(\d+)",
+    lambda m: Indicator(m.group(0), ("fng",), lambda fng, span=int(m.group(1)): fng.ewm(span=span, adjust=False).mean()),
+)
+register_pattern(
+    r"fng_sma(\d+)",
+    lambda m: Indicator(m.group(0), ("fng",), lambda fng, w=int(m.group(1)): fng.rolling(w, min_periods=1).mean()),
+)
+
+
+@register("ema200_soft", inputs=("fng_ema200",))
+def _ema200_soft(ema: pd.Series) -> pd.Series:
+    return ema
+
+
+# ---------------------------------------------------------------------------
+# Indicateurs Rainbow
+# ---------------------------------------------------------------------------
+
+def _rainbow_frame(model: str) -> Indicator:
+    def func(date: pd.Series, close: pd.Series) -> pd.DataFrame:
+        from .strategy import calculate_rainbow_position
+        d = calculate_rainbow_position(pd.DataFrame({"date": date, "close": close}), model=model)
+        return d.drop(columns=["date", "close"])
+    return Indicator(f"rainbow:{model}", ("date", "close"), func)
+
+
+register_pattern(r"rainbow:(\w+)", lambda m: _rainbow_frame(m.group(1)))
+register_pattern(
+    r"rainbow_position(?::(\w+))?",
+    lambda m: Indicator(m.group(0), (f"rainbow:{m.group(1) or 'full'}",), lambda r: r["rainbow_position"]),
+)
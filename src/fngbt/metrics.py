@@ -1,3 +1,4 @@
+from dataclasses import dataclass, replace
 import pandas as pd, numpy as np
 
 ANN = 365
@@ -36,3 +37,307 @@ def compute_metrics(d: pd.DataFrame) -> dict:
         "Calmar": float(calmar),
         "Days": int(n),
     }
+
+
+def _max_dd_rows(equity: np.ndarray) -> np.ndarray:
+    return np.minimum((equity / np.maximum.accumulate(equity, axis=1) - 1.0).min(axis=1), 0.0)
+
+
+def compute_metrics_batch(strategy_ret, turnover=None, ret=None) -> dict:
+    """
+    `compute_metrics` vectorisé sur une matrice (N × jours) de rendements de stratégie
+
+    Réductions par axe uniquement (aucune boucle Python par ligne). L'equity est
+    recomposée depuis les rendements (base 1 au premier jour).
+
+    Args:
+        strategy_ret: rendements journaliers (N × jours), une ligne par config / chemin
+        turnover: turnover journalier (N × jours) → trades, turnover_total
+        ret: rendements BTC (jours,) ou (N × jours) → métriques Buy & Hold
+
+    Returns:
+        dict métrique → tableau de longueur N
+    """
+    sr = np.atleast_2d(np.asarray(strategy_ret, dtype=float))
+    rows, n = sr.shape
+    days = max(n, 1)
+    equity = np.cumprod(1.0 + sr, axis=1)
+    eq_final = equity[:, -1]
+    neg = sr < 0
+    kn = neg.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cagr = eq_final ** (ANN / days) - 1
+        vol = sr.std(axis=1, ddof=1) * np.sqrt(ANN)
+        mean = sr.mean(axis=1) * ANN
+        # Écart-type des seuls rendements négatifs, par masque (pas de filtrage par ligne)
+        neg_mean = np.where(neg, sr, 0.0).sum(axis=1) / kn
+        neg_var = np.where(neg, (sr - neg_mean[:, None]) ** 2, 0.0).sum(axis=1) / (kn - 1)
+        dvol = np.where(kn > 1, np.sqrt(neg_var), np.nan) * np.sqrt(ANN)
+    mdd = _max_dd_rows(equity)
+    out = {
+        "EquityFinal": eq_final,
+        "CAGR": cagr,
+        "Vol": vol,
+        "MaxDD": mdd,
+        "Sharpe": mean / (vol + 1e-12),
+        "Sortino": mean / (dvol + 1e-12),
+        "Calmar": cagr / (np.abs(mdd) + 1e-12),
+        "Days": np.full(rows, days),
+    }
+    if turnover is not None:
+        to = np.broadcast_to(np.asarray(turnover, dtype=float), sr.shape)
+        out["trades"] = (to > 1e-6).sum(axis=1)
+        out["turnover_total"] = to.sum(axis=1)
+    if ret is not None:
+        r = np.broadcast_to(np.asarray(ret, dtype=float), sr.shape)
+        bh = np.cumprod(1.0 + r, axis=1)
+        with np.errstate(invalid="ignore"):
+            out["BHEquityFinal"] = bh[:, -1]
+            out["BHCAGR"] = bh[:, -1] ** (ANN / days) - 1
+            out["BHVol"] = r.std(axis=1, ddof=1) * np.sqrt(ANN)
+        out["BHMaxDD"] = _max_dd_rows(bh)
+    return out
+
+
+@dataclass
+class MetricsAccumulator:
+    """
+    Métriques en flux : mise à jour O(1) par jour, fusion de segments contigus
+
+    Moyenne/variance de Welford (Vol, Sharpe), variance des rendements négatifs
+    (Sortino), croissance cumulée, plus haut/plus bas et drawdown max par segment
+    (stratégie et Buy & Hold). `a.merge(b)` = métriques de a suivi de b, exactes,
+    sans garder les séries journalières (folds, live, backtests par blocs).
+    """
+    n: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    bh_mean: float = 0.0
+    bh_m2: float = 0.0
+    neg_n: int = 0
+    neg_mean: float = 0.0
+    neg_m2: float = 0.0
+    growth: float = 1.0       # equity finale / equity initiale du segment
+    peak: float = -np.inf     # plus haut de l'equity relative du segment
+    trough: float = np.inf    # plus bas de l'equity relative du segment
+    mdd: float = 0.0
+    bh_growth: float = 1.0
+    bh_peak: float = -np.inf
+    bh_trough: float = np.inf
+    bh_mdd: float = 0.0
+    trades: int = 0
+    turnover: float = 0.0
+    weight_sum: float = 0.0
+
+    def update(self, strategy_ret: float, ret: float = 0.0, turnover: float = 0.0, weight: float = 0.0) -> "MetricsAccumulator":
+        """Ajoute un jour (rendement stratégie, rendement BTC, turnover, poids 0-1)."""
+        self.n += 1
+        delta = strategy_ret - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (strategy_ret - self.mean)
+        delta = ret - self.bh_mean
+        self.bh_mean += delta / self.n
+        self.bh_m2 += delta * (ret - self.bh_mean)
+        if strategy_ret < 0:
+            self.neg_n += 1
+            delta = strategy_ret - self.neg_mean
+            self.neg_mean += delta / self.neg_n
+            self.neg_m2 += delta * (strategy_ret - self.neg_mean)
+        self.growth *= 1.0 + strategy_ret
+        self.peak = max(self.peak, self.growth)
+        self.trough = min(self.trough, self.growth)
+        self.mdd = min(self.mdd, self.growth / self.peak - 1.0)
+        self.bh_growth *= 1.0 + ret
+        self.bh_peak = max(self.bh_peak, self.bh_growth)
+        self.bh_trough = min(self.bh_trough, self.bh_growth)
+        self.bh_mdd = min(self.bh_mdd, self.bh_growth / self.bh_peak - 1.0)
+        self.trades += int(turnover > 1e-6)
+        self.turnover += turnover
+        self.weight_sum += weight
+        return self
+
+    @classmethod
+    def from_arrays(cls, strategy_ret, ret=None, turnover=None, weight=None) -> "MetricsAccumulator":
+        """Segment entier en quelques passes vectorisées (équivalent à `update` jour par jour)."""
+        sr = np.asarray(strategy_ret, dtype=float)
+        if len(sr) == 0:
+            return cls()
+        r = np.zeros_like(sr) if ret is None else np.asarray(ret, dtype=float)
+        to = np.zeros_like(sr) if turnover is None else np.asarray(turnover, dtype=float)
+        neg = sr[sr < 0]
+        eq = np.cumprod(1.0 + sr)
+        bh = np.cumprod(1.0 + r)
+        return cls(
+            n=len(sr),
+            mean=float(sr.mean()),
+            m2=float(((sr - sr.mean()) ** 2).sum()),
+            bh_mean=float(r.mean()),
+            bh_m2=float(((r - r.mean()) ** 2).sum()),
+            neg_n=len(neg),
+            neg_mean=float(neg.mean()) if len(neg) else 0.0,
+            neg_m2=float(((neg - neg.mean()) ** 2).sum()) if len(neg) else 0.0,
+            growth=float(eq[-1]),
+            peak=float(eq.max()),
+            trough=float(eq.min()),
+            mdd=min(float((eq / np.maximum.accumulate(eq) - 1.0).min()), 0.0),
+            bh_growth=float(bh[-1]),
+            bh_peak=float(bh.max()),
+            bh_trough=float(bh.min()),
+            bh_mdd=min(float((bh / np.maximum.accumulate(bh) - 1.0).min()), 0.0),
+            trades=int((to > 1e-6).sum()),
+            turnover=float(to.sum()),
+            weight_sum=0.0 if weight is None else float(np.sum(weight)),
+        )
+
+    @staticmethod
+    def _merge_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+        n = n_a + n_b
+        if n == 0:
+            return 0.0, 0.0
+        delta = mean_b - mean_a
+        return mean_a + delta * n_b / n, m2_a + m2_b + delta * delta * n_a * n_b / n
+
+    def merge(self, other: "MetricsAccumulator") -> "MetricsAccumulator":
+        """Accumulateur du segment `self` immédiatement suivi du segment `other`."""
+        if self.n == 0:
+            return replace(other)
+        if other.n == 0:
+            return replace(self)
+        mean, m2 = self._merge_moments(self.n, self.mean, self.m2, other.n, other.mean, other.m2)
+        bh_mean, bh_m2 = self._merge_moments(self.n, self.bh_mean, self.bh_m2, other.n, other.bh_mean, other.bh_m2)
+        neg_mean, neg_m2 = self._merge_moments(
+            self.neg_n, self.neg_mean, self.neg_m2, other.neg_n, other.neg_mean, other.neg_m2
+        )
+        # Drawdown de `other` mesuré depuis le plus haut de `self` : plus bas de other / plus haut de self
+        g, bh_g = self.growth, self.bh_growth
+        return MetricsAccumulator(
+            n=self.n + other.n,
+            mean=mean,
+            m2=m2,
+            bh_mean=bh_mean,
+            bh_m2=bh_m2,
+            neg_n=self.neg_n + other.neg_n,
+            neg_mean=neg_mean,
+            neg_m2=neg_m2,
+            growth=g * other.growth,
+            peak=max(self.peak, g * other.peak),
+            trough=min(self.trough, g * other.trough),
+            mdd=min(self.mdd, other.mdd, g * other.trough / self.peak - 1.0),
+            bh_growth=bh_g * other.bh_growth,
+            bh_peak=max(self.bh_peak, bh_g * other.bh_peak),
+            bh_trough=min(self.bh_trough, bh_g * other.bh_trough),
+            bh_mdd=min(self.bh_mdd, other.bh_mdd, bh_g * other.bh_trough / self.bh_peak - 1.0),
+            trades=self.trades + other.trades,
+            turnover=self.turnover + other.turnover,
+            weight_sum=self.weight_sum + other.weight_sum,
+        )
+
+    __add__ = merge
+
+    def metrics(self) -> dict:
+        """Mêmes clés que `compute_metrics` (+ trades, turnover_total, avg_allocation)."""
+        n = max(self.n, 1)
+        std = np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else np.nan
+        bh_std = np.sqrt(self.bh_m2 / (self.n - 1)) if self.n > 1 else np.nan
+        neg_std = np.sqrt(self.neg_m2 / (self.neg_n - 1)) if self.neg_n > 1 else np.nan
+        with np.errstate(invalid="ignore"):
+            cagr = np.float64(self.growth) ** (ANN / n) - 1
+            bh_cagr = np.float64(self.bh_growth) ** (ANN / n) - 1
+        vol = std * np.sqrt(ANN)
+        mean = self.mean * ANN
+        mdd = min(self.mdd, 0.0)
+        return {
+            "EquityFinal": float(self.growth),
+            "BHEquityFinal": float(self.bh_growth),
+            "CAGR": float(cagr),
+            "BHCAGR": float(bh_cagr),
+            "Vol": float(vol),
+            "BHVol": float(bh_std * np.sqrt(ANN)),
+            "MaxDD": float(mdd),
+            "BHMaxDD": float(min(self.bh_mdd, 0.0)),
+            "Sharpe": float(mean / (vol + 1e-12)),
+            "Sortino": float(mean / (neg_std * np.sqrt(ANN) + 1e-12)),
+            "Calmar": float(cagr / (abs(mdd) + 1e-12)),
+            "Days": int(n),
+            "trades": int(self.trades),
+            "turnover_total": float(self.turnover),
+            "avg_allocation": float(self.weight_sum / n * 100),
+        }
+
+
+class PrefixMetrics:
+    """
+    Métriques de n'importe quel segment [a, b) d'un backtest complet, sans le rejouer
+
+    Sommes préfixes des log-rendements (croissance), des rendements, de leurs carrés,
+    des carrés négatifs (Sortino) et des trades : chaque segment s'obtient par
+    différence en O(1), plus une passe sur le segment pour le max drawdown.
+    """
+
+    def __init__(self, strategy_ret, ret, turnover=None):
+        sr = np.asarray(strategy_ret, dtype=float)
+        r = np.asarray(ret, dtype=float)
+        to = np.zeros_like(sr) if turnover is None else np.asarray(turnover, dtype=float)
+        # Centrage global : limite l'annulation dans S2 - S1² / n
+        self._c, self._bh_c = float(sr.mean()), float(r.mean())
+        x, y = sr - self._c, r - self._bh_c
+        neg = sr < 0
+        xn = np.where(neg, sr, 0.0)
+
+        def prefix(v):
+            out = np.zeros(len(v) + 1)
+            np.cumsum(v, out=out[1:])
+            return out
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self._log = prefix(np.log1p(sr))
+            self._bh_log = prefix(np.log1p(r))
+        self._s1, self._s2 = prefix(x), prefix(x * x)
+        self._bh_s1, self._bh_s2 = prefix(y), prefix(y * y)
+        self._neg_n, self._neg_s1, self._neg_s2 = prefix(neg.astype(float)), prefix(xn), prefix(xn * xn)
+        self._trades = prefix((to > 1e-6).astype(float))
+        # Equity relative (log) pour la passe drawdown par segment
+        self._log_eq, self._bh_log_eq = self._log[1:], self._bh_log[1:]
+
+    @staticmethod
+    def _std(s1: float, s2: float, n: float) -> float:
+        if n < 2:
+            return np.nan
+        return float(np.sqrt(max(s2 - s1 * s1 / n, 0.0) / (n - 1)))
+
+    @staticmethod
+    def _max_dd(log_eq: np.ndarray) -> float:
+        return float(min(np.expm1((log_eq - np.maximum.accumulate(log_eq)).min()), 0.0))
+
+    def segment(self, a: int, b: int) -> dict:
+        """Mêmes clés que `compute_metrics` (+ trades), equity rebasée à 1 au début du segment."""
+        n = b - a
+        days = max(n, 1)
+        growth = float(np.exp(self._log[b] - self._log[a]))
+        bh_growth = float(np.exp(self._bh_log[b] - self._bh_log[a]))
+        s1 = self._s1[b] - self._s1[a]
+        mean = (s1 / n + self._c) * ANN if n else np.nan
+        vol = self._std(s1, self._s2[b] - self._s2[a], n) * np.sqrt(ANN)
+        bh_vol = self._std(self._bh_s1[b] - self._bh_s1[a], self._bh_s2[b] - self._bh_s2[a], n) * np.sqrt(ANN)
+        dvol = self._std(self._neg_s1[b] - self._neg_s1[a], self._neg_s2[b] - self._neg_s2[a],
+                         self._neg_n[b] - self._neg_n[a]) * np.sqrt(ANN)
+        mdd = self._max_dd(self._log_eq[a:b]) if n else 0.0
+        bh_mdd = self._max_dd(self._bh_log_eq[a:b]) if n else 0.0
+        with np.errstate(invalid="ignore"):
+            cagr = np.float64(growth) ** (ANN / days) - 1
+            bh_cagr = np.float64(bh_growth) ** (ANN / days) - 1
+        return {
+            "EquityFinal": growth,
+            "BHEquityFinal": bh_growth,
+            "CAGR": float(cagr),
+            "BHCAGR": float(bh_cagr),
+            "Vol": float(vol),
+            "BHVol": float(bh_vol),
+            "MaxDD": mdd,
+            "BHMaxDD": bh_mdd,
+            "Sharpe": float(mean / (vol + 1e-12)),
+            "Sortino": float(mean / (dvol + 1e-12)),
+            "Calmar": float(cagr / (abs(mdd) + 1e-12)),
+            "Days": int(days),
+            "trades": int(round(self._trades[b] - self._trades[a])),
+        }
@@ -0,0 +1,148 @@
+"""
+Robustesse Monte Carlo par bootstrap par blocs
+
+Au lieu d'un seul chemin historique, on tire des milliers de chemins synthétiques
+en rééchantillonnant des blocs de jours consécutifs (bootstrap stationnaire ou à
+blocs fixes). Chaque jour tiré garde son rendement BTC *et* ses signaux du même
+jour (FNG, position Rainbow → allocation cible), puis la config est rejouée sur
+chaque chemin : filtre de changement minimum, exécution J+1 et frais.
+
+Tout est calculé en matrices (chemins × jours), par blocs de chemins traités
+en parallèle.
+"""
+from __future__ import annotations
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+
+from .metrics import compute_metrics_batch
+from .strategy import FeatureFrame, StrategyConfig, as_feature_frame, build_signals, filter_min_change_batch
+
+BootstrapMethod = Literal["stationary", "block"]
+
+
+def bootstrap_indices(
+    n_obs: int,
+    n_paths: int,
+    n_days: int | None = None,
+    block_len: float = 20.0,
+    method: BootstrapMethod = "stationary",
+    rng: np.random.Generator | None = None,
+) -> np.ndarray:
+    """
+    Indices de jours (n_paths × n_days) tirés par blocs, circulairement dans [0, n_obs)
+
+    - stationary : longueurs de blocs géométriques de moyenne `block_len` (Politis-Romano)
+    - block : blocs de longueur fixe `block_len`
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    n_days = n_obs if n_days is None else n_days
+    steps = np.arange(n_days)
+    if method == "stationary":
+        new_block = rng.random((n_paths, n_days)) < 1.0 / max(block_len, 1.0)
+        new_block[:, 0] = True
+    elif method == "block":
+        new_block = np.broadcast_to(steps % max(int(block_len), 1) == 0, (n_paths, n_days))
+    else:
+        raise ValueError(f"Méthode de bootstrap inconnue: {method}")
+    starts = rng.integers(0, n_obs, size=(n_paths, n_days))
+    # Jour de début du bloc courant, puis décalage à l'intérieur du bloc
+    block_start = np.maximum.accumulate(np.where(new_block, steps, 0), axis=1)
+    return (np.take_along_axis(starts, block_start, axis=1) + (steps - block_start)) % n_obs
+
+
+def _path_metrics(ret: np.ndarray, pos: np.ndarray, fee_rate: float) -> dict[str, np.ndarray]:
+    """Métriques de `run_backtest` pour chaque chemin (lignes de `ret` / `pos`)."""
+    w = pos / 100.0
+    turnover = np.abs(np.diff(w, axis=1, prepend=0.0))
+    m = compute_metrics_batch(w * ret - turnover * fee_rate, turnover=turnover, ret=ret)
+    return {"score": m["EquityFinal"] / np.maximum(m["BHEquityFinal"], 1e-12), **m}
+
+
+@dataclass
+class MonteCarloResult:
+    """Une ligne de métriques par chemin synthétique"""
+    metrics: pd.DataFrame
+    cfg: StrategyConfig
+    method: str
+    block_len: float
+
+    def summary(self, level: float = 0.90) -> pd.DataFrame:
+        """Moyenne, médiane et intervalle de confiance (quantiles) de chaque métrique."""
+        lo, hi = (1 - level) / 2, 1 - (1 - level) / 2
+        m = self.metrics
+        return pd.DataFrame({
+            "mean": m.mean(),
+            "median": m.median(),
+            f"q{lo * 100:g}": m.quantile(lo),
+            f"q{hi * 100:g}": m.quantile(hi),
+            "std": m.std(),
+        })
+
+    def ci(self, metric: str = "score", level: float = 0.90) -> tuple[float, float]:
+        lo, hi = (1 - level) / 2, 1 - (1 - level) / 2
+        q = self.metrics[metric].quantile([lo, hi])
+        return float(q.iloc[0]), float(q.iloc[1])
+
+    def prob_beats(self, metric: str = "score", threshold: float = 1.0) -> float:
+        """Part des chemins où `metric` dépasse `threshold` (ex: score > 1 = bat le Buy & Hold)."""
+        return float((self.metrics[metric] > threshold).mean())
+
+
+def monte_carlo(
+    df: pd.DataFrame | FeatureFrame,
+    cfg: StrategyConfig,
+    n_paths: int = 10_000,
+    n_days: int | None = None,
+    block_len: float = 20.0,
+    method: BootstrapMethod = "stationary",
+    fees_bps: float = 10.0,
+    chunk_paths: int = 500,
+    max_workers: int | None = None,
+    seed: int | None = 42,
+) -> MonteCarloResult:
+    """
+    Rejoue `cfg` sur `n_paths` chemins bootstrap (rendements appariés au FNG et au Rainbow du jour)
+
+    Args:
+        n_days: longueur des chemins (défaut: longueur de l'historique)
+        block_len: longueur (moyenne si stationary) des blocs, en jours
+        chunk_paths: chemins par bloc (mémoire ~ 8 matrices chunk_paths × n_days)
+        max_workers: threads (défaut: nb de cœurs) ; NumPy et le filtre numba relâchent le GIL
+        seed: graine ; les résultats ne dépendent pas de `max_workers`
+
+    Returns:
+        MonteCarloResult (metrics: une ligne par chemin)
+    """
+    ff = as_feature_frame(df)
+    close = ff.raw["close"].to_numpy(dtype=float)
+    ret = np.zeros(len(close))
+    ret[1:] = close[1:] / close[:-1] - 1.0
+    np.nan_to_num(ret, copy=False, nan=0.0)
+    # Allocation cible du jour : fonction des seuls signaux du jour (FNG, Rainbow)
+    alloc = build_signals(ff, cfg)["pos_raw"].to_numpy(dtype=float)
+    fee_rate = fees_bps / 10_000.0
+
+    sizes = [min(chunk_paths, n_paths - i) for i in range(0, n_paths, chunk_paths)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    def run_chunk(args) -> pd.DataFrame:
+        size, ss = args
+        idx = bootstrap_indices(len(close), size, n_days, block_len, method, np.random.default_rng(ss))
+        r = ret[idx]
+        r[:, 0] = 0.0  # pas de rendement le premier jour, comme run_backtest
+        pos = filter_min_change_batch(alloc[idx], cfg.min_position_change_pct)
+        if cfg.execute_next_day:
+            pos[:, 1:] = pos[:, :-1].copy()
+            pos[:, 0] = 0.0
+        return pd.DataFrame(_path_metrics(r, pos, fee_rate))
+
+    workers = max_workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(run_chunk, zip(sizes, seeds)))
+    metrics = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    return MonteCarloResult(metrics=metrics, cfg=cfg, method=method, block_len=block_len)
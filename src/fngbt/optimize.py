@@ -5,13 +5,22 @@ Grid Search et Optuna pour trouver les meilleurs seuils FNG et Rainbow
 """
 from __future__ import annotations
 import itertools
-from typing import Callable, Dict, Iterable, List, Tuple, Optional
+from typing import Callable, Dict, Iterable, List, Literal, Tuple, Optional
 import optuna
 import pandas as pd
 import numpy as np
 
-from .backtest import run_backtest
-from .strategy import StrategyConfig, build_signals
+from .backtest import backtest_arrays, run_backtest, run_backtest_batch
+from .metrics import PrefixMetrics
+from .quality import DEFAULT_MAX_GAP_DAYS, quality_gate
+from .strategy import (
+    FeatureFrame,
+    StrategyConfig,
+    as_feature_frame,
+    build_positions_batch,
+    build_signals,
+    build_signals_lean,
+)
 
 
 def param_grid(space: Dict[str, Iterable]) -> List[Dict]:
@@ -49,18 +58,35 @@ def default_search_space() -> Dict[str, Iterable]:
     }
 
 
-def evaluate_config(df: pd.DataFrame, cfg: StrategyConfig, fees_bps: float) -> Dict:
+def evaluate_config(
+    df: pd.DataFrame | FeatureFrame,
+    cfg: StrategyConfig,
+    fees_bps: float,
+    lean: bool = False,
+    max_gap_days: int | None = DEFAULT_MAX_GAP_DAYS,
+) -> Dict:
     """
-    Évalue une configuration sur tout le dataset
+    Évalue une configuration sur tout le dataset (DataFrame ou FeatureFrame pré-calculé)
+
+    Args:
+        lean: si True, signaux sans colonnes de diagnostic et backtest par le noyau
+              fusionné, sans DataFrame journalier ('df' vaut None). Métriques identiques.
+        max_gap_days: `quality_gate` sur les données (même contrôle que `grid_search`
+              et `run_backtest`) ; None le désactive
 
     Returns:
         dict avec 'metrics', 'df', 'config'
     """
-    # Génération des signaux
-    signals_df = build_signals(df, cfg)
+    if max_gap_days is not None:
+        quality_gate(df.raw if isinstance(df, FeatureFrame) else df, max_gap_days=max_gap_days)
 
-    # Backtest
-    result = run_backtest(signals_df, fees_bps=fees_bps)
+    # Génération des signaux + backtest (données déjà contrôlées ci-dessus)
+    if lean:
+        ff = as_feature_frame(df)
+        sig = build_signals_lean(ff, cfg, dtype=np.float64)
+        result = {"df": None, "metrics": backtest_arrays(ff.raw["close"].to_numpy(), sig.pos, fees_bps)}
+    else:
+        result = run_backtest(build_signals(df, cfg), fees_bps=fees_bps, max_gap_days=None)
 
     # Calcul de trades par an
     metrics = result["metrics"]
@@ -75,6 +101,30 @@ def evaluate_config(df: pd.DataFrame, cfg: StrategyConfig, fees_bps: float) -> D
     }
 
 
+def evaluate_configs(
+    df: pd.DataFrame | FeatureFrame,
+    cfgs: List[StrategyConfig],
+    fees_bps: float,
+    chunk_size: int = 256,
+) -> List[Dict]:
+    """
+    Version batch de `evaluate_config` (métriques seulement)
+
+    Les positions sont construites et backtestées par blocs de `chunk_size` configs
+    (`build_positions_batch` + `run_backtest_batch`) : la mémoire reste bornée quelle
+    que soit la taille de la grille.
+
+    Returns:
+        Une dict de métriques par config, identique à `evaluate_config(...)["metrics"]`
+    """
+    ff = as_feature_frame(df)
+    chunks = (build_positions_batch(ff, cfgs[i:i + chunk_size]) for i in range(0, len(cfgs), chunk_size))
+    table = run_backtest_batch(ff.raw["close"].to_numpy(), chunks, fees_bps)
+    years = max(len(ff) / 365.0, 1e-9)
+    table["trades_per_year"] = table["trades"] / years
+    return table.to_dict("records")
+
+
 def score_result(metrics: Dict[str, float]) -> float:
     """
     Score d'une configuration
@@ -91,11 +141,12 @@ def score_result(metrics: Dict[str, float]) -> float:
 
 
 def walk_forward_cv(
-    df: pd.DataFrame,
+    df: pd.DataFrame | FeatureFrame,
     cfg: StrategyConfig,
     fees_bps: float,
     n_folds: int = 5,
-    train_ratio: float = 0.6
+    train_ratio: float = 0.6,
+    mode: Literal["refit", "prefix"] = "refit",
 ) -> Dict:
     """
     Walk-Forward Cross-Validation
@@ -106,16 +157,22 @@ def walk_forward_cv(
     - Test sur le reste
 
     Args:
-        df: DataFrame complet
+        df: DataFrame complet, ou FeatureFrame (features des folds réutilisées)
         cfg: Configuration à tester
         fees_bps: Frais en basis points
         n_folds: Nombre de périodes de test
         train_ratio: Ratio train/test (ex: 0.6 = 60% train, 40% test)
+        mode: "refit" = signaux et backtest recalculés par fold sur [contexte, test] ;
+              "prefix" = un seul backtest sur toute la série, métriques de chaque
+              fold par sommes préfixes (equity rebasée au début du test)
 
     Returns:
         dict avec métriques agrégées et détails par fold
     """
-    d = df.sort_values("date").reset_index(drop=True)
+    if isinstance(df, FeatureFrame):
+        d = df
+    else:
+        d = FeatureFrame(df.sort_values("date").reset_index(drop=True))
     n = len(d)
 
     if n < 100:
@@ -128,6 +185,16 @@ def walk_forward_cv(
 
     fold_results = []
 
+    if mode == "prefix":
+        # Un seul backtest complet : full_metrics + sommes préfixes pour les folds
+        sig = build_signals_lean(d, cfg, dtype=np.float64)
+        buffers = {}
+        full_metrics = backtest_arrays(d.raw["close"].to_numpy(), sig.pos, fees_bps, buffers=buffers)
+        full_metrics["trades_per_year"] = full_metrics["trades"] / max(full_metrics["Days"] / 365.0, 1e-9)
+        prefix = PrefixMetrics(buffers["strategy_ret"], buffers["ret"], buffers["turnover"])
+    elif mode != "refit":
+        raise ValueError(f"Mode walk-forward inconnu: {mode}")
+
     for i in range(n_folds):
         # Indices de la fenêtre
         fold_start = i * fold_size
@@ -140,24 +207,32 @@ def walk_forward_cv(
         if test_end - test_start < 30:
             continue
 
+        if mode == "prefix":
+            test_metrics = prefix.segment(test_start, test_end)
+            test_metrics["trades_per_year"] = test_metrics["trades"] / max(test_metrics["Days"] / 365.0, 1e-9)
+            fold_results.append({
+                "fold": i,
+                "train_start": train_start,
+                "train_end": train_end,
+                "test_start": test_start,
+                "test_end": test_end,
+                "metrics": test_metrics
+            })
+            continue
+
         # Données de test (on garde aussi un peu de contexte pour les calculs)
         # On prend 365 jours avant test_start si possible pour avoir le contexte Rainbow
         context_start = max(0, test_start - 365)
-        test_df = d.iloc[context_start:test_end].copy()
-
-        # Évaluation sur cette période de test
-        result = evaluate_config(test_df, cfg, fees_bps)
-
-        # On garde seulement les métriques de la période de test pure
-        # (après le contexte)
-        actual_test_start = test_start - context_start
-        test_only_df = result["df"].iloc[actual_test_start:].copy()
-
-        # Recalcul des métriques sur la période de test pure
-        from .metrics import compute_metrics
-        test_metrics = compute_metrics(test_only_df)
-        test_metrics["trades"] = int(test_only_df["trade"].sum())
-        days = len(test_only_df)
+        test_df = d.slice(context_start, test_end)
+
+        # Évaluation sur cette période de test : métriques sur la période de test
+        # pure (après le contexte), l'equity restant cumulée depuis le contexte
+        sig = build_signals_lean(test_df, cfg, dtype=np.float64)
+        test_metrics = backtest_arrays(
+            test_df.raw["close"].to_numpy(), sig.pos, fees_bps, start=test_start - context_start
+        )
+        del test_metrics["turnover_total"], test_metrics["avg_allocation"]
+        days = test_metrics["Days"]
         years = max(days / 365.0, 1e-9)
         test_metrics["trades_per_year"] = test_metrics["trades"] / years
 
@@ -172,12 +247,13 @@ def walk_forward_cv(
 
     if not fold_results:
         # Fallback: évaluation sur tout le dataset
-        result = evaluate_config(d, cfg, fees_bps)
+        if mode != "prefix":
+            full_metrics = evaluate_config(d, cfg, fees_bps, lean=True, max_gap_days=None)["metrics"]
         return {
             "folds": [],
-            "median_metrics": result["metrics"],
+            "median_metrics": full_metrics,
             "all_folds_metrics": [],
-            "full_metrics": result["metrics"]
+            "full_metrics": full_metrics
         }
 
     # Agrégation: médiane des métriques sur tous les folds
@@ -189,19 +265,20 @@ def walk_forward_cv(
         values = [m[key] for m in all_folds_metrics if key in m]
         median_metrics[key] = float(np.median(values))
 
-    # Évaluation sur le dataset complet pour référence
-    full_result = evaluate_config(d, cfg, fees_bps)
+    # Évaluation sur le dataset complet pour référence (déjà faite en mode prefix)
+    if mode != "prefix":
+        full_metrics = evaluate_config(d, cfg, fees_bps, lean=True, max_gap_days=None)["metrics"]
 
     return {
         "folds": fold_results,
         "median_metrics": median_metrics,
         "all_folds_metrics": all_folds_metrics,
-        "full_metrics": full_result["metrics"]
+        "full_metrics": full_metrics
     }
 
 
 def grid_search(
-    df: pd.DataFrame,
+    df: pd.DataFrame | FeatureFrame,
     search_space: Dict[str, Iterable],
     fees_bps: float = 10.0,
     use_walk_forward: bool = True,
@@ -209,6 +286,8 @@ def grid_search(
     wf_train_ratio: float = 0.6,
     min_trades_per_year: float = 1.0,
     progress_cb: Optional[Callable[[int, int, Optional[float]], None]] = None,
+    wf_mode: Literal["refit", "prefix"] = "refit",
+    max_gap_days: int | None = DEFAULT_MAX_GAP_DAYS,
 ) -> pd.DataFrame:
     """
     Grid Search avec Walk-Forward ou évaluation simple
@@ -222,6 +301,9 @@ def grid_search(
         wf_train_ratio: Ratio train/test
         min_trades_per_year: Filtre minimum de trades/an
         progress_cb: Callback(current, total, best_score)
+        wf_mode: "refit" (backtest par fold) ou "prefix" (un backtest, folds par sommes préfixes)
+        max_gap_days: `quality_gate` sur les données avant toute évaluation (doublons,
+            NaN, trous) ; None désactive le contrôle
 
     Returns:
         DataFrame avec résultats triés par score
@@ -229,6 +311,11 @@ def grid_search(
     combos = param_grid(search_space)
     total = len(combos)
 
+    # Features Rainbow calculées une fois pour toutes les combinaisons
+    df = as_feature_frame(df)
+    if max_gap_days is not None:
+        quality_gate(df.raw, max_gap_days=max_gap_days)
+
     print(f"\n🔍 Grid Search: {total} combinaisons à tester")
     print(f"📊 Walk-Forward: {'OUI' if use_walk_forward else 'NON'}")
     if use_walk_forward:
@@ -238,6 +325,11 @@ def grid_search(
     results = []
     best_score = -float("inf")
 
+    # Sans walk-forward : toute la grille backtestée en batch, par blocs
+    batch_metrics = None
+    if not use_walk_forward:
+        batch_metrics = evaluate_configs(df, [StrategyConfig(**params) for params in combos], fees_bps)
+
     for idx, params in enumerate(combos, start=1):
         cfg = StrategyConfig(**params)
 
@@ -246,14 +338,14 @@ def grid_search(
             wf_result = walk_forward_cv(
                 df, cfg, fees_bps,
                 n_folds=wf_n_folds,
-                train_ratio=wf_train_ratio
+                train_ratio=wf_train_ratio,
+                mode=wf_mode,
             )
             metrics = wf_result["median_metrics"]
             full_metrics = wf_result["full_metrics"]
         else:
             # Évaluation simple sur tout le dataset
-            result = evaluate_config(df, cfg, fees_bps)
-            metrics = result["metrics"]
+            metrics = batch_metrics[idx - 1]
             full_metrics = metrics
 
         # Filtre: nombre minimum de trades par an
@@ -297,7 +389,7 @@ def grid_search(
 
 
 def optuna_search(
-    df: pd.DataFrame,
+    df: pd.DataFrame | FeatureFrame,
     search_space: Dict[str, Iterable],
     n_trials: int = 100,
     fees_bps: float = 10.0,
@@ -306,11 +398,14 @@ def optuna_search(
     wf_train_ratio: float = 0.6,
     min_trades_per_year: float = 1.0,
     progress_cb: Optional[Callable[[int, int, Optional[float]], None]] = None,
+    wf_mode: Literal["refit", "prefix"] = "refit",
+    max_gap_days: int | None = DEFAULT_MAX_GAP_DAYS,
 ) -> pd.DataFrame:
     """
     Optimisation avec Optuna
 
-    Plus efficace que Grid Search pour grands espaces de recherche
+    Plus efficace que Grid Search pour grands espaces de recherche.
+    `max_gap_days` : voir `grid_search` (contrôle qualité préalable, None le désactive).
     """
     print(f"\n🔍 Optuna Search: {n_trials} trials")
     print(f"📊 Walk-Forward: {'OUI' if use_walk_forward else 'NON'}")
@@ -318,6 +413,11 @@ def optuna_search(
     # Conversion des listes en catégories Optuna
     param_keys = list(search_space.keys())
 
+    # Features Rainbow calculées une fois pour tous les trials
+    df = as_feature_frame(df)
+    if max_gap_days is not None:
+        quality_gate(df.raw, max_gap_days=max_gap_days)
+
     def objective(trial: optuna.Trial):
         """Fonction objectif à maximiser"""
         # Sélection des paramètres
@@ -333,11 +433,12 @@ def optuna_search(
             wf_result = walk_forward_cv(
                 df, cfg, fees_bps,
                 n_folds=wf_n_folds,
-                train_ratio=wf_train_ratio
+                train_ratio=wf_train_ratio,
+                mode=wf_mode,
             )
             metrics = wf_result["median_metrics"]
         else:
-            result = evaluate_config(df, cfg, fees_bps)
+            result = evaluate_config(df, cfg, fees_bps, lean=True, max_gap_days=None)
             metrics = result["metrics"]
 
         # Filtre trades/an
@@ -386,11 +487,13 @@ def optuna_search(
 
         # Ré-évaluation pour avoir toutes les métriques
         if use_walk_forward:
-            wf_result = walk_forward_cv(df, cfg, fees_bps, n_folds=wf_n_folds, train_ratio=wf_train_ratio)
+            wf_result = walk_forward_cv(
+                df, cfg, fees_bps, n_folds=wf_n_folds, train_ratio=wf_train_ratio, mode=wf_mode
+            )
             metrics = wf_result["median_metrics"]
             full_metrics = wf_result["full_metrics"]
         else:
-            result = evaluate_config(df, cfg, fees_bps)
+            result = evaluate_config(df, cfg, fees_bps, lean=True, max_gap_days=None)
             metrics = result["metrics"]
             full_metrics = metrics
 
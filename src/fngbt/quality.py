@@ -0,0 +1,191 @@
+"""
+Contrôle qualité des séries FNG et prix BTC
+
+Trous, doublons, valeurs figées et sauts aberrants, calculés en une passe
+vectorisée sur le DataFrame fusionné, + politique de comblement des trous.
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Literal
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class QualityReport:
+    """Résultat de `check_quality`"""
+    start: pd.Timestamp | None
+    end: pd.Timestamp | None
+    rows: int
+    missing_days: int
+    dup_dates: int
+    max_gap_days: int
+    nan_counts: dict = field(default_factory=dict)
+    gaps: pd.DataFrame = field(default_factory=pd.DataFrame)     # date, gap_days
+    stale: pd.DataFrame = field(default_factory=pd.DataFrame)    # col, start, end, length
+    jumps: pd.DataFrame = field(default_factory=pd.DataFrame)    # col, date, prev, value
+
+    @property
+    def ok(self) -> bool:
+        return (
+            self.missing_days == 0
+            and self.dup_dates == 0
+            and not any(self.nan_counts.values())
+            and self.jumps.empty
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "start": self.start,
+            "end": self.end,
+            "rows": self.rows,
+            "missing_days": self.missing_days,
+            "dup_dates": self.dup_dates,
+            "max_gap_days": self.max_gap_days,
+            "nan": int(sum(self.nan_counts.values())),
+            "stale_runs": len(self.stale),
+            "jumps": len(self.jumps),
+        }
+
+
+def _stale_runs(dates: np.ndarray, v: np.ndarray, min_len: int) -> pd.DataFrame:
+    """Séquences d'au moins `min_len` valeurs identiques consécutives."""
+    new_run = np.r_[True, v[1:] != v[:-1]]
+    run_id = np.cumsum(new_run) - 1
+    lengths = np.bincount(run_id)
+    starts = np.flatnonzero(new_run)
+    keep = lengths >= min_len
+    return pd.DataFrame({
+        "start": dates[starts[keep]],
+        "end": dates[starts[keep] + lengths[keep] - 1],
+        "length": lengths[keep],
+    })
+
+
+def check_quality(
+    df: pd.DataFrame,
+    cols: Iterable[str] = ("fng", "close"),
+    stale_days: int = 5,
+    max_log_jump: float = 0.3,
+    max_fng_jump: float = 50.0,
+) -> QualityReport:
+    """
+    Diagnostic qualité du DataFrame (colonne `date` + colonnes de `cols`).
+
+    Args:
+        stale_days: longueur minimale d'une séquence de valeurs figées signalée
+        max_log_jump: saut |log(close_t / close_t-1)| au-delà duquel le prix est suspect
+        max_fng_jump: saut absolu de FNG (points) au-delà duquel la valeur est suspecte
+    """
+    d = df.sort_values("date", kind="stable")
+    cols = [c for c in cols if c in d.columns]
+    dates = d["date"].to_numpy(dtype="datetime64[ns]")
+    if len(dates) == 0:
+        return QualityReport(None, None, 0, 0, 0, 0)
+
+    day = dates.astype("datetime64[D]").astype(np.int64)
+    step = np.diff(day)
+    gap_idx = np.flatnonzero(step > 1)
+    gaps = pd.DataFrame({"date": dates[gap_idx + 1], "gap_days": step[gap_idx]})
+
+    stale_parts, jump_parts, nan_counts = [], [], {}
+    for col in cols:
+        v = d[col].to_numpy(dtype=float)
+        nan_counts[col] = int(np.isnan(v).sum())
+        if stale_days > 1 and len(v) >= stale_days:
+            stale_parts.append(_stale_runs(dates, v, stale_days).assign(col=col))
+        if col == "close":
+            jump = np.abs(np.diff(np.log(np.clip(v, 1e-12, None)))) > max_log_jump
+        else:
+            jump = np.abs(np.diff(v)) > max_fng_jump
+        j = np.flatnonzero(jump)
+        jump_parts.append(pd.DataFrame({"col": col, "date": dates[j + 1], "prev": v[j], "value": v[j + 1]}))
+
+    stale = pd.concat(stale_parts, ignore_index=True) if stale_parts else pd.DataFrame()
+    jumps = pd.concat(jump_parts, ignore_index=True) if jump_parts else pd.DataFrame()
+    return QualityReport(
+        start=pd.Timestamp(dates[0]),
+        end=pd.Timestamp(dates[-1]),
+        rows=len(dates),
+        missing_days=int((step[step > 1] - 1).sum()),
+        dup_dates=int((step == 0).sum()),
+        max_gap_days=int(step.max()) if len(step) else 0,
+        nan_counts=nan_counts,
+        gaps=gaps,
+        stale=stale,
+        jumps=jumps,
+    )
+
+
+def fill_gaps(
+    df: pd.DataFrame,
+    policy: Literal["ffill", "interpolate", "drop"] = "ffill",
+    cols: Iterable[str] = ("fng", "close"),
+) -> pd.DataFrame:
+    """
+    Dédoublonne puis comble les trous du calendrier journalier.
+
+    - ffill : jours manquants recopiés depuis la dernière valeur connue
+    - interpolate : interpolation linéaire dans le temps
+    - drop : supprime les lignes incomplètes (pas de ré-indexation)
+    """
+    cols = [c for c in cols if c in df.columns]
+    d = df.drop_duplicates("date", keep="last").sort_values("date")
+    if policy == "drop":
+        return d.dropna(subset=cols).reset_index(drop=True)
+
+    d = d.set_index("date").asfreq("D")
+    if policy == "ffill":
+        d[cols] = d[cols].ffill()
+    elif policy == "interpolate":
+        d[cols] = d[cols].interpolate(method="time", limit_area="inside")
+    else:
+        raise ValueError(f"Politique de comblement inconnue: {policy}")
+    return d.rename_axis("date").reset_index()
+
+
+# Trou maximal toléré par défaut (en pas de la série) à tous les points d'entrée :
+# couvre les courtes interruptions de publication du FNG
+DEFAULT_MAX_GAP_DAYS = 7
+
+
+def quality_gate(df: pd.DataFrame, max_gap_days: int = DEFAULT_MAX_GAP_DAYS, allow_jumps: bool = True, **kwargs) -> QualityReport:
+    """
+    Garde-fou bon marché avant un backtest / une optimisation.
+
+    Lève ValueError si dates dupliquées, valeurs manquantes, trou > `max_gap_days`
+    ou (si `allow_jumps=False`) sauts aberrants. Pour une série ré-échantillonnée
+    (hebdo, mensuelle), `max_gap_days` est multiplié par le pas médian de la série.
+    """
+    rep = check_quality(df, **kwargs)
+    day = df["date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+    step = max(int(np.median(np.diff(np.sort(day)))), 1) if len(day) > 1 else 1
+    problems = []
+    if rep.dup_dates:
+        problems.append(f"{rep.dup_dates} dates dupliquées")
+    if any(rep.nan_counts.values()):
+        problems.append(f"valeurs manquantes {rep.nan_counts}")
+    if rep.max_gap_days > max_gap_days * step:
+        problems.append(f"trou de {rep.max_gap_days} jours (max {max_gap_days * step})")
+    if not allow_jumps and not rep.jumps.empty:
+        problems.append(f"{len(rep.jumps)} sauts aberrants")
+    if problems:
+        raise ValueError("Qualité des données insuffisante: " + ", ".join(problems))
+    return rep
+
+
+def _check_csv(path: Path, kwargs: dict) -> QualityReport:
+    df = pd.read_csv(path)
+    df["date"] = pd.to_datetime(df["date"], utc=True, errors="coerce").dt.tz_localize(None)
+    return check_quality(df.dropna(subset=["date"]), **kwargs)
+
+
+def check_csv_files(paths: Iterable[str | Path], max_workers: int = 4, **kwargs) -> dict[str, QualityReport]:
+    """Contrôle plusieurs CSV (colonne `date` + `fng` et/ou `close`) en parallèle."""
+    paths = [Path(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        reports = pool.map(lambda p: _check_csv(p, kwargs), paths)
+        return {str(p): r for p, r in zip(paths, reports)}
@@ -0,0 +1,146 @@
+"""
+Métriques glissantes en O(n) (Sharpe, volatilité, max drawdown, exposition)
+
+- moyenne / variance glissantes par sommes cumulées (pas de rolling-apply)
+- max drawdown glissant par décomposition en blocs de taille `window`
+  (van Herk / Gil-Werman) : agrégats préfixe et suffixe par bloc, puis une
+  fusion par fenêtre. Tout est vectorisé, O(n) quelle que soit la fenêtre.
+
+Chaque fonction accepte une série (jours,) ou une matrice (N × jours), les jours
+sur le dernier axe ; une pd.Series en entrée donne une pd.Series en sortie.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from .metrics import ANN
+
+
+def _as_2d(x) -> tuple[np.ndarray, bool, pd.Index | None]:
+    index = x.index if isinstance(x, pd.Series) else None
+    arr = np.asarray(x, dtype=float)
+    return np.atleast_2d(arr), arr.ndim == 1, index
+
+
+def _wrap(out: np.ndarray, was_1d: bool, index: pd.Index | None):
+    if not was_1d:
+        return out
+    return pd.Series(out[0], index=index) if index is not None else out[0]
+
+
+def _counts(n: int, window: int) -> np.ndarray:
+    return np.minimum(np.arange(1, n + 1), window).astype(float)
+
+
+def _window_sums(x: np.ndarray, window: int) -> np.ndarray:
+    """Somme sur la fenêtre [t-window+1, t] (tronquée au début) par sommes cumulées."""
+    cs = np.zeros((x.shape[0], x.shape[1] + 1))
+    np.cumsum(x, axis=1, out=cs[:, 1:])
+    lag = np.maximum(np.arange(1, x.shape[1] + 1) - window, 0)
+    return cs[:, 1:] - cs[:, lag]
+
+
+def _mask_min_periods(out: np.ndarray, window: int, min_periods: int | None) -> np.ndarray:
+    mp = window if min_periods is None else min_periods
+    out[:, : max(mp - 1, 0)] = np.nan
+    return out
+
+
+def rolling_mean(x, window: int, min_periods: int | None = None):
+    """Moyenne glissante (équivalent de `pd.Series.rolling(window, min_periods).mean()`)."""
+    a, was_1d, index = _as_2d(x)
+    out = _window_sums(a, window) / _counts(a.shape[1], window)
+    return _wrap(_mask_min_periods(out, window, min_periods), was_1d, index)
+
+
+def rolling_std(x, window: int, min_periods: int | None = None, ddof: int = 1):
+    """Écart-type glissant par sommes cumulées (x centré par ligne pour limiter l'annulation)."""
+    a, was_1d, index = _as_2d(x)
+    a = a - a.mean(axis=1, keepdims=True)
+    cnt = _counts(a.shape[1], window)
+    s1 = _window_sums(a, window)
+    s2 = _window_sums(a * a, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = np.maximum(s2 - s1 * s1 / cnt, 0.0) / (cnt - ddof)
+    var[:, cnt <= ddof] = np.nan
+    return _wrap(_mask_min_periods(np.sqrt(var), window, min_periods), was_1d, index)
+
+
+def rolling_vol(strategy_ret, window: int = 365, min_periods: int | None = None):
+    """Volatilité annualisée glissante."""
+    a, was_1d, index = _as_2d(strategy_ret)
+    return _wrap(rolling_std(a, window, min_periods) * np.sqrt(ANN), was_1d, index)
+
+
+def rolling_sharpe(strategy_ret, window: int = 365, min_periods: int | None = None):
+    """Sharpe glissant (même définition que `compute_metrics`, taux sans risque nul)."""
+    a, was_1d, index = _as_2d(strategy_ret)
+    vol = rolling_std(a, window, min_periods) * np.sqrt(ANN)
+    mean = rolling_mean(a, window, min_periods) * ANN
+    return _wrap(mean / (vol + 1e-12), was_1d, index)
+
+
+def rolling_exposure(pos, window: int = 365, min_periods: int | None = None):
+    """Allocation moyenne glissante (en %, comme `avg_allocation`)."""
+    return rolling_mean(pos, window, min_periods)
+
+
+def rolling_max_drawdown(equity, window: int = 365, min_periods: int | None = None):
+    """
+    Pire drawdown (plus haut → plus bas) à l'intérieur de chaque fenêtre [t-window+1, t]
+
+    Un segment se résume en (plus haut P, plus bas T, ratio D = min equity / plus haut courant)
+    et deux segments contigus A puis B fusionnent en D = min(D_A, D_B, T_B / P_A).
+    Par bloc de `window` jours on calcule les agrégats préfixes (vers l'avant) et
+    suffixes (vers l'arrière) ; chaque fenêtre = suffixe d'un bloc + préfixe du suivant.
+    """
+    a, was_1d, index = _as_2d(equity)
+    rows, n = a.shape
+    nb = -(-n // window)
+    pad = np.pad(a, ((0, 0), (0, nb * window - n)), mode="edge").reshape(rows, nb, window)
+
+    # Préfixes par bloc : plus haut, plus bas et pire ratio depuis le début du bloc
+    pre_p = np.maximum.accumulate(pad, axis=2)
+    pre_t = np.minimum.accumulate(pad, axis=2)
+    pre_d = np.minimum.accumulate(pad / pre_p, axis=2)
+
+    # Suffixes par bloc : D_k = min(D_k+1, T_k+1 / x_k)
+    rev = pad[:, :, ::-1]
+    suf_p = np.maximum.accumulate(rev, axis=2)[:, :, ::-1]
+    suf_t = np.minimum.accumulate(rev, axis=2)[:, :, ::-1]
+    ratio = np.ones_like(pad)
+    ratio[:, :, :-1] = suf_t[:, :, 1:] / pad[:, :, :-1]
+    suf_d = np.minimum.accumulate(np.minimum(ratio, 1.0)[:, :, ::-1], axis=2)[:, :, ::-1]
+
+    pre_p, pre_t, pre_d = (x.reshape(rows, -1)[:, :n] for x in (pre_p, pre_t, pre_d))
+    suf_p, suf_d = (x.reshape(rows, -1)[:, :n] for x in (suf_p, suf_d))
+
+    # Fenêtre finissant en t, commençant en s = t-window+1 : suffixe(s) puis préfixe(t)
+    out = pre_d.copy()  # t < window : la fenêtre est le préfixe du premier bloc
+    t = np.arange(window - 1, n)
+    s = t - window + 1
+    split = s % window != 0  # s en début de bloc : la fenêtre est exactement un bloc
+    ts, ss = t[split], s[split]
+    out[:, ts] = np.minimum(np.minimum(suf_d[:, ss], pre_d[:, ts]), pre_t[:, ts] / suf_p[:, ss])
+    out = np.minimum(out, 1.0) - 1.0
+    return _wrap(_mask_min_periods(out, window, min_periods), was_1d, index)
+
+
+def rolling_metrics(d: pd.DataFrame, window: int = 365, min_periods: int | None = None) -> pd.DataFrame:
+    """
+    Métriques glissantes d'un résultat de `run_backtest` (colonnes strategy_ret, equity, pos)
+
+    Returns:
+        DataFrame aligné sur `d` : date, rolling_sharpe, rolling_vol, rolling_maxdd,
+        rolling_exposure (prêt pour `plot_overview(..., rolling=window)`)
+    """
+    out = pd.DataFrame(index=d.index)
+    if "date" in d:
+        out["date"] = d["date"]
+    sr = d["strategy_ret"].to_numpy(dtype=float)
+    out["rolling_sharpe"] = rolling_sharpe(sr, window, min_periods)
+    out["rolling_vol"] = rolling_vol(sr, window, min_periods)
+    out["rolling_maxdd"] = rolling_max_drawdown(d["equity"].to_numpy(dtype=float), window, min_periods)
+    out["rolling_exposure"] = rolling_exposure(d["pos"].fillna(0.0).to_numpy(dtype=float), window, min_periods)
+    return out
@@ -6,10 +6,20 @@ LOGIQUE INVESTISSEUR LONG TERME:
 - VENDRE: FNG haut (GREED) + Prix proche ruban HAUT → Allocation basse
 """
 from __future__ import annotations
+import bisect
+import math
 from dataclasses import dataclass, asdict
+from functools import lru_cache
 import numpy as np
 import pandas as pd
 
+from .indicators import IndicatorStore
+
+try:  # numba optionnel : compile les noyaux séquentiels (filtre de changement minimum)
+    from numba import njit
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    njit = None
+
 
 @dataclass
 class StrategyConfig:
@@ -22,6 +32,10 @@ class StrategyConfig:
     rainbow_buy_threshold: float = 0.3   # En-dessous = prix bas → zone d'achat
     rainbow_sell_threshold: float = 0.7  # Au-dessus = prix haut → zone de vente
 
+    # Paliers FNG optionnels (allocation en escalier, remplace l'interpolation linéaire)
+    fng_buy_levels: tuple[int, ...] | None = None   # ex: (10, 20, 30) → paliers de FEAR
+    fng_sell_levels: tuple[int, ...] | None = None  # ex: (60, 70, 80) → paliers de GREED
+
     # Allocation
     max_allocation_pct: int = 100   # Allocation maximale en %
     min_allocation_pct: int = 0     # Allocation minimale en %
@@ -30,21 +44,132 @@ class StrategyConfig:
     # Exécution
     execute_next_day: bool = True   # Signal J+1 pour éviter look-ahead bias
 
+    # Modèle Rainbow: "full" (régression sur tout l'échantillon), "expanding" (point-in-time)
+    # ou "quantile" (bandes Rainbow v2)
+    rainbow_model: str = "full"
+
+    # Série FNG utilisée: "fng" (brut) ou un indicateur dérivé (ex: "fng_ema200", "ema200_soft")
+    fng_source_col: str = "fng"
+
+    # Position Rainbow quantifiée en K paliers (0 = exacte). Si K > 0 et FNG entier,
+    # l'allocation est lue dans une table 101 × K au lieu d'être recalculée chaque jour
+    rainbow_buckets: int = 0
+
     def to_dict(self) -> dict:
         return asdict(self)
 
+    def fng_levels(self) -> tuple[np.ndarray, np.ndarray] | None:
+        """Paliers (achat, vente) triés, ou None si seuils simples."""
+        if self.fng_buy_levels is None and self.fng_sell_levels is None:
+            return None
+        buy = self.fng_buy_levels if self.fng_buy_levels is not None else [self.fng_buy_threshold]
+        sell = self.fng_sell_levels if self.fng_sell_levels is not None else [self.fng_sell_threshold]
+        return np.sort(np.asarray(buy, dtype=float)), np.sort(np.asarray(sell, dtype=float))
+
+    def score_key(self) -> tuple:
+        """Paramètres dont dépend le score combiné (hors bornes d'allocation)."""
+        levels = (
+            tuple(self.fng_buy_levels) if self.fng_buy_levels is not None else None,
+            tuple(self.fng_sell_levels) if self.fng_sell_levels is not None else None,
+        )
+        return (
+            float(self.fng_buy_threshold), float(self.fng_sell_threshold), *levels,
+            float(self.rainbow_buy_threshold), float(self.rainbow_sell_threshold), int(self.rainbow_buckets),
+        )
+
+
+RAINBOW_MODELS = ("full", "expanding", "quantile")
+
+# Quantiles des écarts log (Rainbow v2) délimitant les bandes de couleur
+RAINBOW_QUANTILES = (0.02, 0.10, 0.20, 0.35, 0.50, 0.65, 0.80, 0.90, 0.98)
+
+
+def fit_rainbow_bands(dates: pd.Series, close: pd.Series, quantiles=RAINBOW_QUANTILES) -> tuple[float, float, np.ndarray]:
+    """
+    Rainbow v2 : régression log-log + bandes aux quantiles des écarts
+
+    Returns:
+        (slope, intercept, band_devs) avec band_devs les écarts log (triés) de chaque bande
+    """
+    days = (pd.to_datetime(dates) - GENESIS).dt.days.clip(lower=1).astype(float)
+    x = np.log10(days)
+    y = np.log10(close.clip(lower=1e-9))
+    slope, intercept = np.polyfit(x, y, deg=1)
+    deviation = np.log10(close.clip(lower=1e-12)) - (intercept + slope * x)
+    return float(slope), float(intercept), np.quantile(deviation, quantiles)
+
+
+def _quantile_position(deviation: np.ndarray, band_devs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Indice de bande par `np.searchsorted` puis position linéaire dans la bande
+
+    Position 0 = bande la plus basse (q02), 1 = bande la plus haute (q98).
+    """
+    band = np.searchsorted(band_devs, deviation, side="right")
+    k = np.clip(band, 1, len(band_devs) - 1)
+    lower, upper = band_devs[k - 1], band_devs[k]
+    frac = np.clip((deviation - lower) / (upper - lower), 0.0, 1.0)
+    position = np.clip((k - 1 + frac) / (len(band_devs) - 1), 0.0, 1.0)
+    return band, position
+
+
+def _expanding_rainbow(x: np.ndarray, y: np.ndarray, log_price: np.ndarray, min_periods: int):
+    """
+    Régression log-log point-in-time en O(n) par sommes cumulées
+
+    Pour chaque jour t, pente et ordonnée sont celles de la régression sur [0, t]
+    (sommes cumulées de x, y, x² et xy), et les écarts min/max sont les extrêmes
+    courants des écarts observés jusqu'à t. Aucune information future n'est utilisée.
+    """
+    x0 = x[0] if len(x) else 0.0
+    xc = x - x0  # centrage : limite les erreurs d'arrondi dans n·Σx² − (Σx)²
+    n = np.arange(1, len(x) + 1, dtype=float)
+    sx, sy = np.cumsum(xc), np.cumsum(y)
+    sxx, sxy = np.cumsum(xc * xc), np.cumsum(xc * y)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = n * sxx - sx * sx
+        slope = (n * sxy - sx * sy) / denom
+        intercept_c = (sy - slope * sx) / n
+    valid = (n >= max(min_periods, 2)) & (denom > 0)
+    slope = np.where(valid, slope, np.nan)
+    log_mid = intercept_c + slope * xc
+
+    deviation = log_price - log_mid
+    dev_lo = np.where(np.isnan(deviation), np.inf, deviation)
+    dev_hi = np.where(np.isnan(deviation), -np.inf, deviation)
+    min_dev = np.minimum.accumulate(dev_lo)
+    max_dev = np.maximum.accumulate(dev_hi)
+
+    # Sécurité : si pas assez de variance
+    narrow = ~(np.abs(max_dev - min_dev) >= 0.1)
+    min_dev = np.where(narrow, -0.5, min_dev)
+    max_dev = np.where(narrow, 0.5, max_dev)
+    return log_mid, min_dev, max_dev
+
+
+GENESIS = pd.Timestamp("2009-01-03")
+
 
-def calculate_rainbow_position(df: pd.DataFrame) -> pd.DataFrame:
+def calculate_rainbow_position(df: pd.DataFrame, model: str = "full", min_periods: int = 30) -> pd.DataFrame:
     """
     Calcule la position du prix dans le Rainbow Chart
 
     Rainbow Chart = régression log-log du prix BTC depuis genesis
     Position 0 = ruban le plus bas, Position 1 = ruban le plus haut
+
+    Args:
+        model: "full" = régression et bandes sur tout l'échantillon (look-ahead),
+               "expanding" = régression et bandes point-in-time (voir `_expanding_rainbow`),
+               "quantile" = bandes Rainbow v2 aux quantiles des écarts (`RAINBOW_QUANTILES`)
+        min_periods: jours minimum avant la première régression (mode "expanding")
     """
+    if model not in RAINBOW_MODELS:
+        raise ValueError(f"Modèle Rainbow inconnu: {model}")
     d = df.copy()
 
     # Genesis Bitcoin: 3 janvier 2009
-    genesis = pd.Timestamp("2009-01-03")
+    genesis = GENESIS
 
     # Jours depuis genesis
     days_since_genesis = (d["date"] - genesis).dt.days.clip(lower=1).astype(float)
@@ -53,6 +178,35 @@ def calculate_rainbow_position(df: pd.DataFrame) -> pd.DataFrame:
     x = np.log10(days_since_genesis)
     y = np.log10(d["close"].clip(lower=1e-9))
 
+    if model == "expanding":
+        log_price = np.log10(d["close"].clip(lower=1e-12))
+        log_mid, min_dev, max_dev = _expanding_rainbow(x.to_numpy(), y.to_numpy(), log_price.to_numpy(), min_periods)
+        log_min = log_mid + min_dev
+        log_max = log_mid + max_dev
+        rainbow_position = pd.Series((log_price.to_numpy() - log_min) / (log_max - log_min), index=d.index)
+
+        d["rainbow_mid"] = 10 ** log_mid
+        d["rainbow_min"] = 10 ** log_min
+        d["rainbow_max"] = 10 ** log_max
+        d["rainbow_position"] = rainbow_position.clip(0.0, 1.0).fillna(0.5)
+        return d
+
+    if model == "quantile":
+        slope, intercept, band_devs = fit_rainbow_bands(d["date"], d["close"])
+        log_mid = (intercept + slope * x).to_numpy()
+        deviation = np.log10(d["close"].clip(lower=1e-12)).to_numpy() - log_mid
+        band, position = _quantile_position(deviation, band_devs)
+
+        d["rainbow_mid"] = 10 ** log_mid
+        d["rainbow_base"] = d["rainbow_mid"]
+        d["rainbow_min"] = 10 ** (log_mid + band_devs[0])
+        d["rainbow_max"] = 10 ** (log_mid + band_devs[-1])
+        for q, dev in zip(RAINBOW_QUANTILES, band_devs):
+            d[f"rainbow_band_{int(round(q * 100)):02d}"] = 10 ** (log_mid + dev)
+        d["rainbow_band"] = band
+        d["rainbow_position"] = pd.Series(position, index=d.index).fillna(0.5)
+        return d
+
     # Calcul de la ligne de régression (milieu du Rainbow)
     coeffs = np.polyfit(x, y, deg=1)
     slope, intercept = coeffs[0], coeffs[1]
@@ -95,33 +249,165 @@ def calculate_rainbow_position(df: pd.DataFrame) -> pd.DataFrame:
     return d
 
 
-def calculate_allocation(df: pd.DataFrame, cfg: StrategyConfig) -> pd.DataFrame:
+class FeatureFrame:
+    """
+    Colonnes Rainbow pré-calculées, indépendantes de StrategyConfig
+
+    La régression log-log et les bandes sont calculées une seule fois par dataset
+    (et une fois par tranche via `slice`), puis réutilisées par toutes les configs.
+    `build_signals`, `evaluate_config`, `walk_forward_cv`, `grid_search` et
+    `optuna_search` acceptent un FeatureFrame à la place du DataFrame.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        if not df["date"].is_monotonic_increasing:
+            df = df.sort_values("date").reset_index(drop=True)
+        self.raw = df
+        self.indicators = IndicatorStore(df)
+        self._models: dict[str, pd.DataFrame] = {}
+        self._slices: dict[tuple[int, int], FeatureFrame] = {}
+        self._index: dict[tuple, np.ndarray | None] = {}
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def features(self, model: str = "full") -> pd.DataFrame:
+        """Données brutes + colonnes Rainbow du modèle demandé (calculées au premier accès)."""
+        if model not in self._models:
+            rainbow = self.indicators.get(f"rainbow:{model}")
+            # Colonnes Rainbow déjà présentes (frame issu de build_signals, autre modèle) :
+            # celles du modèle demandé les remplacent, sans doublon de libellé
+            raw = self.raw.drop(columns=rainbow.columns, errors="ignore")
+            self._models[model] = pd.concat([raw, rainbow], axis=1)
+        return self._models[model]
+
+    def fng(self, source_col: str = "fng") -> pd.Series:
+        """Série FNG brute ou indicateur dérivé (mémoïsé)."""
+        return self.indicators.get(source_col)
+
+    def fng_index(self, source_col: str = "fng") -> np.ndarray | None:
+        """Indice de table FNG (0-100) mémoïsé, None si la série n'est pas entière."""
+        key = ("fng", source_col)
+        if key not in self._index:
+            self._index[key] = fng_bucket_index(self.fng(source_col).to_numpy())
+        return self._index[key]
+
+    def rainbow_index(self, model: str, k: int) -> np.ndarray:
+        """Indice de palier Rainbow (0..k-1) mémoïsé par (modèle, k)."""
+        key = ("rainbow", model, k)
+        if key not in self._index:
+            self._index[key] = rainbow_bucket_index(self.features(model)["rainbow_position"].to_numpy(), k)
+        return self._index[key]
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self.features("full")
+
+    def slice(self, start: int, stop: int) -> "FeatureFrame":
+        """Features recalculées sur la tranche [start, stop) (mémoïsé par tranche)."""
+        key = (start, stop)
+        if key not in self._slices:
+            self._slices[key] = FeatureFrame(self.raw.iloc[start:stop])
+        return self._slices[key]
+
+
+def as_feature_frame(df: pd.DataFrame | FeatureFrame) -> FeatureFrame:
+    return df if isinstance(df, FeatureFrame) else FeatureFrame(df)
+
+
+def fng_level_score(fng: np.ndarray, buy_levels, sell_levels) -> np.ndarray:
+    """
+    Score FNG en escalier via `np.digitize` sur les paliers
+
+    Chaque palier d'achat dépassé (fng > palier) et chaque palier de vente atteint
+    (fng >= palier) retire 1/K du score, K = nombre total de paliers.
+    Avec un seul palier de chaque côté: 1 (≤ achat), 0.5 entre les deux, 0 (≥ vente).
+    """
+    buy = np.sort(np.asarray(buy_levels, dtype=float))
+    sell = np.sort(np.asarray(sell_levels, dtype=float))
+    bucket = np.digitize(fng, buy, right=True) + np.digitize(fng, sell, right=False)
+    score = 1.0 - bucket / float(len(buy) + len(sell))
+    return np.where(np.isnan(fng), np.nan, score)
+
+
+def fng_bucket_index(fng) -> np.ndarray | None:
+    """FNG entier 0-100 → indice de table (intp), ou None si valeurs non entières / manquantes."""
+    fng = np.asarray(fng, dtype=float)
+    if not (np.all(np.isfinite(fng)) and np.all(fng == np.round(fng)) and fng.min(initial=0) >= 0 and fng.max(initial=0) <= 100):
+        return None
+    return fng.astype(np.intp)
+
+
+def rainbow_bucket_index(rainbow_position, k: int) -> np.ndarray:
+    """Position Rainbow [0, 1] → palier 0..k-1 (intp)."""
+    pos = np.asarray(rainbow_position, dtype=float)
+    return np.clip((pos * k).astype(np.intp), 0, k - 1)
+
+
+def quantize_rainbow(rainbow_position, k: int):
+    """Position Rainbow ramenée au centre de son palier (identité si k = 0)."""
+    if k <= 0:
+        return rainbow_position
+    centers = (np.arange(k) + 0.5) / k
+    q = centers[rainbow_bucket_index(rainbow_position, k)]
+    return pd.Series(q, index=rainbow_position.index) if isinstance(rainbow_position, pd.Series) else q
+
+
+def fng_level_score_batch(fng, buy_levels_list, sell_levels_list, fng_index: np.ndarray | None = None) -> np.ndarray:
+    """
+    Scores FNG en escalier pour N combinaisons de paliers
+
+    Une table de 101 scores (FNG 0..100) est construite par combinaison ; le score
+    de chaque jour est alors une simple lecture `table[:, fng_index]`.
+
+    Returns:
+        Matrice (N × jours)
+    """
+    fng = np.asarray(fng, dtype=float)
+    if fng_index is None:
+        fng_index = fng_bucket_index(fng)
+    if fng_index is None:  # FNG lissé (non entier): calcul direct
+        return np.stack([fng_level_score(fng, b, s) for b, s in zip(buy_levels_list, sell_levels_list)])
+    grid = np.arange(101, dtype=float)
+    tables = np.stack([fng_level_score(grid, b, s) for b, s in zip(buy_levels_list, sell_levels_list)])
+    return tables[:, fng_index]
+
+
+def calculate_allocation(df: pd.DataFrame, cfg: StrategyConfig, fng: pd.Series | None = None) -> pd.DataFrame:
     """
     Calcule l'allocation en fonction du FNG et Rainbow Chart
 
+    `fng` remplace la colonne `fng` (ex: FNG lissé de `cfg.fng_source_col`).
+
     LOGIQUE:
     - FNG bas + Rainbow bas → Allocation HAUTE (acheter)
     - FNG haut + Rainbow haut → Allocation BASSE (vendre)
     """
     d = df.copy()
+    fng = d["fng"] if fng is None else fng
 
     # Normalisation FNG (0-100 → 0-1)
-    fng_normalized = d["fng"] / 100.0
+    fng_normalized = fng / 100.0
 
     # Score d'achat basé sur FNG (1 = max FEAR, 0 = max GREED)
     # Interpolation linéaire entre les seuils
-    fng_buy_score = np.where(
-        d["fng"] <= cfg.fng_buy_threshold,
-        1.0,  # FEAR maximum → achat fort
-        np.where(
-            d["fng"] >= cfg.fng_sell_threshold,
-            0.0,  # GREED maximum → pas d'achat
-            (cfg.fng_sell_threshold - d["fng"]) / (cfg.fng_sell_threshold - cfg.fng_buy_threshold)
+    levels = cfg.fng_levels()
+    if levels is not None:
+        # Paliers: score en escalier (1 sous tous les paliers d'achat, 0 au-delà de tous ceux de vente)
+        fng_buy_score = fng_level_score(np.asarray(fng, dtype=float), *levels)
+    else:
+        fng_buy_score = np.where(
+            fng <= cfg.fng_buy_threshold,
+            1.0,  # FEAR maximum → achat fort
+            np.where(
+                fng >= cfg.fng_sell_threshold,
+                0.0,  # GREED maximum → pas d'achat
+                (cfg.fng_sell_threshold - fng) / (cfg.fng_sell_threshold - cfg.fng_buy_threshold)
+            )
         )
-    )
 
     # Score d'achat basé sur Rainbow (1 = prix très bas, 0 = prix très haut)
-    rainbow_pos = d["rainbow_position"]
+    rainbow_pos = quantize_rainbow(d["rainbow_position"], cfg.rainbow_buckets)
     rainbow_buy_score = np.where(
         rainbow_pos <= cfg.rainbow_buy_threshold,
         1.0,  # Prix bas → achat fort
@@ -150,35 +436,244 @@ def calculate_allocation(df: pd.DataFrame, cfg: StrategyConfig) -> pd.DataFrame:
     return d
 
 
-def build_signals(df: pd.DataFrame, cfg: StrategyConfig) -> pd.DataFrame:
+def _col(v) -> np.ndarray:
+    """Paramètre scalaire ou par config → colonne (N, 1) pour le broadcasting."""
+    return np.asarray(v, dtype=float).reshape(-1, 1)
+
+
+def calculate_allocation_batch(
+    fng,
+    rainbow_position,
+    fng_buy_threshold,
+    fng_sell_threshold,
+    rainbow_buy_threshold,
+    rainbow_sell_threshold,
+    min_allocation_pct=0,
+    max_allocation_pct=100,
+    fng_score: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Version batch de `calculate_allocation` : N configs en un seul calcul broadcasté
+
+    Chaque seuil est un scalaire ou un tableau de longueur N. `fng_score` (N × jours),
+    si fourni, remplace le score FNG par seuils (ex: paliers, `fng_level_score_batch`).
+
+    Returns:
+        Matrice (N × jours) des allocations en %, identique à `allocation_pct`
+        calculé config par config.
+    """
+    fng = np.atleast_2d(np.asarray(fng, dtype=float))
+    rainbow_pos = np.atleast_2d(np.asarray(rainbow_position, dtype=float))
+    fng_buy, fng_sell = _col(fng_buy_threshold), _col(fng_sell_threshold)
+    rb_buy, rb_sell = _col(rainbow_buy_threshold), _col(rainbow_sell_threshold)
+    lo, hi = _col(min_allocation_pct), _col(max_allocation_pct)
+
+    if fng_score is not None:
+        fng_buy_score = fng_score
+    else:
+        fng_buy_score = np.where(
+            fng <= fng_buy,
+            1.0,
+            np.where(fng >= fng_sell, 0.0, (fng_sell - fng) / (fng_sell - fng_buy)),
+        )
+    rainbow_buy_score = np.where(
+        rainbow_pos <= rb_buy,
+        1.0,
+        np.where(rainbow_pos >= rb_sell, 0.0, (rb_sell - rainbow_pos) / (rb_sell - rb_buy)),
+    )
+    combined_score = (fng_buy_score + rainbow_buy_score) / 2.0
+    allocation_pct = lo + combined_score * (hi - lo)
+    return np.clip(allocation_pct, lo, hi)
+
+
+@lru_cache(maxsize=4096)
+def _score_table(key: tuple) -> np.ndarray:
+    cfg = StrategyConfig(
+        fng_buy_threshold=key[0], fng_sell_threshold=key[1],
+        fng_buy_levels=key[2], fng_sell_levels=key[3],
+        rainbow_buy_threshold=key[4], rainbow_sell_threshold=key[5], rainbow_buckets=key[6],
+    )
+    grid = pd.DataFrame({"fng": np.repeat(np.arange(101.0), key[6]),
+                         "rainbow_position": np.tile((np.arange(key[6]) + 0.5) / key[6], 101)})
+    table = calculate_allocation(grid, cfg)["combined_score"].to_numpy().reshape(101, key[6])
+    table.setflags(write=False)
+    return table
+
+
+def score_table(cfg: StrategyConfig) -> np.ndarray:
+    """
+    Score combiné (0-1) tabulé : 101 valeurs de FNG entier × `cfg.rainbow_buckets` paliers
+
+    Mis en cache par `cfg.score_key()` : partagé par toutes les configs qui ne
+    diffèrent que par leurs bornes d'allocation.
+    """
+    if cfg.rainbow_buckets <= 0:
+        raise ValueError("score_table nécessite rainbow_buckets > 0.")
+    return _score_table(cfg.score_key())
+
+
+def allocation_table(cfg: StrategyConfig) -> np.ndarray:
+    """Table 101 × K de l'allocation en % (bornes min/max de `cfg` appliquées)."""
+    lo, hi = cfg.min_allocation_pct, cfg.max_allocation_pct
+    return np.clip(lo + score_table(cfg) * (hi - lo), lo, hi)
+
+
+def allocation_lookup_batch(ff: FeatureFrame, cfgs: list[StrategyConfig]) -> np.ndarray:
+    """
+    Allocation (N × jours) par simple indexation entière dans les tables
+
+    Toutes les configs doivent avoir `rainbow_buckets > 0` et une série FNG entière
+    (`ff.fng_index(...)` non None). Le score n'est lu qu'une fois par table distincte ;
+    les bornes d'allocation sont appliquées ensuite, config par config.
+    """
+    scores = {}
+    rows = []
+    for cfg in cfgs:
+        key = (cfg.score_key(), cfg.rainbow_model, cfg.fng_source_col)
+        if key not in scores:
+            table = score_table(cfg)
+            scores[key] = table[ff.fng_index(cfg.fng_source_col), ff.rainbow_index(cfg.rainbow_model, cfg.rainbow_buckets)]
+        rows.append(scores[key])
+    p = config_arrays(cfgs)
+    lo, hi = _col(p["min_allocation_pct"]), _col(p["max_allocation_pct"])
+    return np.clip(lo + np.stack(rows) * (hi - lo), lo, hi)
+
+
+def _lut_ok(ff: FeatureFrame, cfg: StrategyConfig) -> bool:
+    return cfg.rainbow_buckets > 0 and ff.fng_index(cfg.fng_source_col) is not None
+
+
+def config_arrays(cfgs: list[StrategyConfig]) -> dict[str, np.ndarray]:
+    """Liste de StrategyConfig → un tableau NumPy par paramètre (pour les API batch)."""
+    out = {}
+    for k in StrategyConfig.__dataclass_fields__:
+        vals = [getattr(c, k) for c in cfgs]
+        if k in ("fng_buy_levels", "fng_sell_levels"):
+            arr = np.empty(len(vals), dtype=object)  # séquences de longueurs variables
+            arr[:] = vals
+            out[k] = arr
+        else:
+            out[k] = np.array(vals)
+    return out
+
+
+def _fng_scores_for_configs(fng: np.ndarray, cfgs: list[StrategyConfig]) -> np.ndarray | None:
+    """Scores FNG (N × jours) si au moins une config utilise des paliers, sinon None."""
+    levels = [c.fng_levels() for c in cfgs]
+    if all(lv is None for lv in levels):
+        return None
+    fng = np.broadcast_to(fng, (len(cfgs), fng.shape[-1]))
+    out = np.empty(fng.shape)
+    rows = [i for i, lv in enumerate(levels) if lv is None]
+    if rows:
+        buy = _col([cfgs[i].fng_buy_threshold for i in rows])
+        sell = _col([cfgs[i].fng_sell_threshold for i in rows])
+        f = fng[rows]
+        out[rows] = np.where(f <= buy, 1.0, np.where(f >= sell, 0.0, (sell - f) / (sell - buy)))
+    rows = [i for i, lv in enumerate(levels) if lv is not None]
+    # Regroupement par série FNG (une seule table d'indices par série)
+    for src in dict.fromkeys(cfgs[i].fng_source_col for i in rows):
+        grp = [i for i in rows if cfgs[i].fng_source_col == src]
+        out[grp] = fng_level_score_batch(
+            fng[grp[0]], [levels[i][0] for i in grp], [levels[i][1] for i in grp]
+        )
+    return out
+
+
+def _min_change_loop(x: np.ndarray, min_change: float) -> np.ndarray:
+    out = np.empty(x.shape[0])
+    current_pos = 0.0
+    for i in range(x.shape[0]):
+        if abs(x[i] - current_pos) >= min_change:
+            current_pos = x[i]
+        out[i] = current_pos
+    return out
+
+
+def _min_change_batch_loop(x: np.ndarray, min_change: np.ndarray) -> np.ndarray:
+    out = np.empty_like(x)
+    for r in range(x.shape[0]):
+        current_pos = 0.0
+        m = min_change[r]
+        for i in range(x.shape[1]):
+            if abs(x[r, i] - current_pos) >= m:
+                current_pos = x[r, i]
+            out[r, i] = current_pos
+    return out
+
+
+if njit is not None:
+    _min_change_kernel = njit(nogil=True)(_min_change_loop)
+    _min_change_batch_kernel = njit(nogil=True)(_min_change_batch_loop)
+else:
+    def _min_change_kernel(x: np.ndarray, min_change: float) -> np.ndarray:
+        # Boucle sur des floats Python (bien plus rapide que d'itérer une Series)
+        out = []
+        current_pos = 0.0
+        for target in x.tolist():
+            if abs(target - current_pos) >= min_change:
+                current_pos = target
+            out.append(current_pos)
+        return np.asarray(out, dtype=float)
+
+    def _min_change_batch_kernel(x: np.ndarray, min_change: np.ndarray) -> np.ndarray:
+        # Boucle sur les jours, vectorisée sur les configs
+        out = np.empty_like(x)
+        current_pos = np.zeros(x.shape[0])
+        for i in range(x.shape[1]):
+            col = x[:, i]
+            current_pos = np.where(np.abs(col - current_pos) >= min_change, col, current_pos)
+            out[:, i] = current_pos
+        return out
+
+
+def filter_min_change(pos_raw, min_change: float) -> np.ndarray:
+    """
+    Filtre d'hystérésis : la position ne change que si l'écart avec la position
+    courante (départ à 0) atteint `min_change`. Compilé avec numba si disponible.
+    """
+    x = np.ascontiguousarray(pos_raw, dtype=float)
+    return _min_change_kernel(x, float(min_change))
+
+
+def filter_min_change_batch(pos_raw: np.ndarray, min_change) -> np.ndarray:
+    """
+    Version batch de `filter_min_change` sur une matrice (configs × jours).
+
+    `min_change` : scalaire ou un seuil par config (longueur = nb de lignes).
+    """
+    x = np.ascontiguousarray(np.atleast_2d(pos_raw), dtype=float)
+    m = np.broadcast_to(np.asarray(min_change, dtype=float), (x.shape[0],)).copy()
+    return _min_change_batch_kernel(x, m)
+
+
+def build_signals(df: pd.DataFrame | FeatureFrame, cfg: StrategyConfig) -> pd.DataFrame:
     """
     Construit les signaux de trading complets
 
-    1. Calcule la position Rainbow
+    1. Calcule la position Rainbow (sauf si `df` est un FeatureFrame)
     2. Calcule l'allocation optimale
     3. Applique le seuil de changement minimum
     4. Applique l'exécution J+1 si nécessaire
     """
-    # Calcul Rainbow Chart
-    d = calculate_rainbow_position(df)
+    # Calcul Rainbow Chart (réutilisé tel quel depuis un FeatureFrame)
+    if isinstance(df, FeatureFrame):
+        d = df.features(cfg.rainbow_model)
+        fng_used = df.fng(cfg.fng_source_col) if cfg.fng_source_col != "fng" else None
+    else:
+        d = calculate_rainbow_position(df, model=cfg.rainbow_model)
+        fng_used = IndicatorStore(df).get(cfg.fng_source_col) if cfg.fng_source_col != "fng" else None
 
-    # Calcul de l'allocation
-    d = calculate_allocation(d, cfg)
+    # Calcul de l'allocation (sur le FNG lissé si demandé)
+    d = calculate_allocation(d, cfg, fng=fng_used)
+    if fng_used is not None:
+        d["fng_used"] = fng_used
 
     # Position cible (avant filtrage)
     d["pos_raw"] = d["allocation_pct"]
 
     # Filtrage: on ne change de position que si le changement est > seuil
-    min_change = cfg.min_position_change_pct
-    pos_filtered = []
-    current_pos = 0.0
-
-    for target in d["pos_raw"]:
-        # Si changement > seuil, on ajuste
-        if abs(target - current_pos) >= min_change:
-            current_pos = target
-        pos_filtered.append(current_pos)
-
+    pos_filtered = filter_min_change(d["pos_raw"].to_numpy(), cfg.min_position_change_pct)
     d["pos_target"] = pd.Series(pos_filtered, index=d.index)
 
     # Position réelle (avec décalage J+1 si nécessaire)
@@ -192,3 +687,211 @@ def build_signals(df: pd.DataFrame, cfg: StrategyConfig) -> pd.DataFrame:
     d["trade"] = (d["pos_change"].abs() > 0.01).astype(int)
 
     return d
+
+
+@dataclass
+class LeanSignals:
+    """Signaux compacts (sans colonnes de diagnostic) pour l'optimisation"""
+    pos: np.ndarray     # position en % (float32 par défaut)
+    trade: np.ndarray   # 1 si changement de position ce jour (int8)
+
+
+def build_signals_lean(df: pd.DataFrame | FeatureFrame, cfg: StrategyConfig, dtype=np.float32) -> LeanSignals:
+    """
+    Mode léger de `build_signals` : aucune copie du DataFrame ni colonne de diagnostic
+
+    Renvoie seulement les positions et les trades. Avec `dtype=np.float64`, `pos`
+    est identique à la colonne `pos` de `build_signals`.
+    """
+    ff = as_feature_frame(df)
+    alloc = _allocation_rows(ff, [cfg])[0]
+    pos_target = filter_min_change(alloc, cfg.min_position_change_pct)
+    if cfg.execute_next_day:
+        pos = np.empty_like(pos_target)
+        pos[0] = 0.0
+        pos[1:] = pos_target[:-1]
+    else:
+        pos = pos_target
+    trade = np.zeros(len(pos), dtype=np.int8)
+    trade[1:] = np.abs(np.diff(pos)) > 0.01
+    return LeanSignals(pos=pos.astype(dtype, copy=False), trade=trade)
+
+
+def _rows_by_key(keys: np.ndarray, getter) -> np.ndarray:
+    """Une ligne par config, calculée une seule fois par valeur distincte de `keys`."""
+    uniq = list(dict.fromkeys(keys))
+    if len(uniq) == 1:
+        return getter(uniq[0])[None, :]
+    cache = {k: getter(k) for k in uniq}
+    return np.stack([cache[k] for k in keys])
+
+
+def _formula_allocation(ff: FeatureFrame, cfgs: list[StrategyConfig]) -> np.ndarray:
+    p = config_arrays(cfgs)
+    rainbow_pos = _rows_by_key(
+        list(zip(p["rainbow_model"], p["rainbow_buckets"])),
+        lambda mk: quantize_rainbow(ff.features(mk[0])["rainbow_position"].to_numpy(), int(mk[1])),
+    )
+    fng = _rows_by_key(p["fng_source_col"], lambda c: ff.fng(c).to_numpy())
+    return calculate_allocation_batch(
+        fng,
+        rainbow_pos,
+        p["fng_buy_threshold"],
+        p["fng_sell_threshold"],
+        p["rainbow_buy_threshold"],
+        p["rainbow_sell_threshold"],
+        p["min_allocation_pct"],
+        p["max_allocation_pct"],
+        fng_score=_fng_scores_for_configs(fng, cfgs),
+    )
+
+
+def _allocation_rows(ff: FeatureFrame, cfgs: list[StrategyConfig]) -> np.ndarray:
+    """Allocation (N × jours) : table de lookup si possible, formule sinon."""
+    lut = [i for i, c in enumerate(cfgs) if _lut_ok(ff, c)]
+    if not lut:
+        return _formula_allocation(ff, cfgs)
+    if len(lut) == len(cfgs):
+        return allocation_lookup_batch(ff, cfgs)
+    rest = [i for i in range(len(cfgs)) if i not in set(lut)]
+    alloc = np.empty((len(cfgs), len(ff)))
+    alloc[lut] = allocation_lookup_batch(ff, [cfgs[i] for i in lut])
+    alloc[rest] = _formula_allocation(ff, [cfgs[i] for i in rest])
+    return alloc
+
+
+def build_positions_batch(df: pd.DataFrame | FeatureFrame, cfgs: list[StrategyConfig]) -> np.ndarray:
+    """
+    Positions finales (colonne `pos` de `build_signals`) pour N configs à la fois
+
+    Allocation broadcastée, filtre de changement minimum batch puis décalage J+1.
+
+    Returns:
+        Matrice (N × jours) des positions en %
+    """
+    ff = as_feature_frame(df)
+    p = config_arrays(cfgs)
+    alloc = _allocation_rows(ff, cfgs)
+    pos = filter_min_change_batch(alloc, p["min_position_change_pct"])
+    shifted = np.zeros_like(pos)
+    shifted[:, 1:] = pos[:, :-1]
+    return np.where(p["execute_next_day"][:, None], shifted, pos)
+
+
+class StrategyState:
+    """
+    État incrémental de la stratégie pour l'allocation quotidienne en live
+
+    Construit une fois depuis l'historique (`from_history`), puis mis à jour
+    jour par jour en O(1) avec `update`. L'état contient les sommes de la
+    régression Rainbow (modèle "expanding"), les écarts min/max courants, la
+    position cible filtrée et l'ordre en attente pour J+1.
+
+    Reproduit `build_signals` avec `rainbow_model="expanding"` (seul modèle
+    calculable sans réajuster tout l'historique).
+    """
+
+    def __init__(self, cfg: StrategyConfig, min_periods: int = 30):
+        if cfg.fng_source_col != "fng":
+            raise ValueError("StrategyState ne supporte que fng_source_col='fng'.")
+        if cfg.rainbow_model != "expanding":
+            raise ValueError("StrategyState ne supporte que rainbow_model='expanding'.")
+        self.cfg = cfg
+        self.min_periods = min_periods
+        self.n = 0
+        self.x0: float | None = None
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+        self.min_dev = math.inf
+        self.max_dev = -math.inf
+        self.pos_target = 0.0   # position cible filtrée (ordre pour J+1)
+        self.pos = 0.0          # position effectivement détenue aujourd'hui
+        self.rainbow_position = 0.5
+        self.date: pd.Timestamp | None = None
+
+    @classmethod
+    def from_history(cls, df: pd.DataFrame, cfg: StrategyConfig, min_periods: int = 30) -> "StrategyState":
+        state = cls(cfg, min_periods=min_periods)
+        d = df.sort_values("date")
+        for date, fng, close in zip(d["date"], d["fng"].tolist(), d["close"].tolist()):
+            state.update(date, fng, close)
+        return state
+
+    def _rainbow_position(self, date: pd.Timestamp, close: float) -> float:
+        x = math.log10(max((pd.Timestamp(date) - GENESIS).days, 1))
+        y = math.log10(max(close, 1e-9))
+        if self.x0 is None:
+            self.x0 = x
+        xc = x - self.x0
+        self.n += 1
+        self.sx += xc
+        self.sy += y
+        self.sxx += xc * xc
+        self.sxy += xc * y
+
+        n = float(self.n)
+        denom = n * self.sxx - self.sx * self.sx
+        if self.n < max(self.min_periods, 2) or not denom > 0:
+            return 0.5
+        slope = (n * self.sxy - self.sx * self.sy) / denom
+        log_mid = (self.sy - slope * self.sx) / n + slope * xc
+
+        log_price = math.log10(max(close, 1e-12))
+        deviation = log_price - log_mid
+        self.min_dev = min(self.min_dev, deviation)
+        self.max_dev = max(self.max_dev, deviation)
+        min_dev, max_dev = self.min_dev, self.max_dev
+        if not abs(max_dev - min_dev) >= 0.1:
+            min_dev, max_dev = -0.5, 0.5
+        pos = (log_price - (log_mid + min_dev)) / (max_dev - min_dev)
+        return min(max(pos, 0.0), 1.0)
+
+    def _allocation(self, fng: float, rainbow_pos: float) -> float:
+        cfg = self.cfg
+        if cfg.rainbow_buckets > 0:
+            k = cfg.rainbow_buckets
+            rainbow_pos = (min(max(int(rainbow_pos * k), 0), k - 1) + 0.5) / k
+        levels = cfg.fng_levels()
+        if levels is not None:
+            buy, sell = levels
+            if math.isnan(fng):
+                fng_score = math.nan
+            else:
+                bucket = bisect.bisect_left(buy, fng) + bisect.bisect_right(sell, fng)
+                fng_score = 1.0 - bucket / float(len(buy) + len(sell))
+        elif fng <= cfg.fng_buy_threshold:
+            fng_score = 1.0
+        elif fng >= cfg.fng_sell_threshold:
+            fng_score = 0.0
+        else:
+            fng_score = (cfg.fng_sell_threshold - fng) / (cfg.fng_sell_threshold - cfg.fng_buy_threshold)
+        if rainbow_pos <= cfg.rainbow_buy_threshold:
+            rainbow_score = 1.0
+        elif rainbow_pos >= cfg.rainbow_sell_threshold:
+            rainbow_score = 0.0
+        else:
+            rainbow_score = (cfg.rainbow_sell_threshold - rainbow_pos) / (cfg.rainbow_sell_threshold - cfg.rainbow_buy_threshold)
+        combined_score = (fng_score + rainbow_score) / 2.0
+        lo, hi = cfg.min_allocation_pct, cfg.max_allocation_pct
+        return min(max(lo + combined_score * (hi - lo), lo), hi)
+
+    def update(self, date, fng: float, close: float) -> float:
+        """
+        Intègre l'observation du jour et renvoie la nouvelle allocation cible (%).
+
+        Avec `execute_next_day`, `pos` reste la cible de la veille (ordre exécuté
+        aujourd'hui) et la valeur renvoyée est l'ordre pour demain.
+
+        Les dates doivent être strictement croissantes : une date déjà intégrée
+        fausserait les sommes de la régression (ValueError, état inchangé).
+        """
+        date = pd.Timestamp(date)
+        if self.date is not None and date <= self.date:
+            raise ValueError(f"StrategyState: date {date.date()} déjà intégrée (dernière: {self.date.date()}).")
+        self.rainbow_position = self._rainbow_position(date, float(close))
+        target = self._allocation(float(fng), self.rainbow_position)
+        previous_target = self.pos_target
+        if abs(target - self.pos_target) >= self.cfg.min_position_change_pct:
+            self.pos_target = target
+        self.pos = previous_target if self.cfg.execute_next_day else self.pos_target
+        self.date = date
+        return self.pos_target
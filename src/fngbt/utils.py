@@ -4,6 +4,7 @@ import pandas as pd
 from pathlib import Path
 from typing import Optional
 
+from .rolling import rolling_metrics
 from .strategy import StrategyConfig
 
 
@@ -26,18 +27,28 @@ def plot_equity(d: pd.DataFrame, title: str, out: Optional[str] = None):
     plt.show()
 
 
-def plot_overview(d: pd.DataFrame, cfg: StrategyConfig | None, title: str = "", out: Optional[str] = None):
+def plot_overview(
+    d: pd.DataFrame,
+    cfg: StrategyConfig | None,
+    title: str = "",
+    out: Optional[str] = None,
+    rolling: Optional[int] = None,
+):
     """
     Vue en 3 panneaux : prix BTC (log) + Rainbow/alloc, FNG, equity.
+
+    `rolling` (jours, ex: 365) ajoute un 4e panneau : Sharpe et max drawdown glissants.
     """
-    fig, axes = plt.subplots(3, 1, figsize=(11, 10), sharex=True)
+    n_panels = 4 if rolling else 3
+    fig, axes = plt.subplots(n_panels, 1, figsize=(11, 10 + 3 * (n_panels - 3)), sharex=True)
 
     # Prix BTC sur log + Rainbow + allocation
     ax_price = axes[0]
     ax_price.plot(d["date"], d["close"], label="BTC-USD", color="#2d6cdf")
     ax_price.set_yscale("log")
-    if cfg and cfg.use_rainbow and "rainbow_base" in d:
-        ax_price.plot(d["date"], d["rainbow_base"], label="Rainbow mid (fit)", color="#f59f00", alpha=0.8)
+    base_col = "rainbow_base" if "rainbow_base" in d else "rainbow_mid"
+    if cfg and getattr(cfg, "use_rainbow", True) and base_col in d:
+        ax_price.plot(d["date"], d[base_col], label="Rainbow mid (fit)", color="#f59f00", alpha=0.8)
         if "rainbow_min" in d:
             ax_price.plot(d["date"], d["rainbow_min"], color="#18a957", linestyle="--", alpha=0.9, label="Ruban bas")
         if "rainbow_max" in d:
@@ -71,9 +82,9 @@ def plot_overview(d: pd.DataFrame, cfg: StrategyConfig | None, title: str = "",
         ax_sent.plot(d["date"], d["fng"], label="F&G brut", color="#f59f00", alpha=0.25, linestyle="--")
     else:
         ax_sent.plot(d["date"], fng_plot, label="Fear & Greed", color="#f59f00")
-    if cfg and cfg.use_fng and hasattr(cfg, "fng_buy"):
-        ax_sent.axhline(cfg.fng_buy, color="#18a957", linestyle="--", linewidth=1, label="Seuil achat")
-        ax_sent.axhline(cfg.fng_sell, color="#d7263d", linestyle="--", linewidth=1, label="Seuil vente")
+    if cfg and getattr(cfg, "use_fng", True) and hasattr(cfg, "fng_buy_threshold"):
+        ax_sent.axhline(cfg.fng_buy_threshold, color="#18a957", linestyle="--", linewidth=1, label="Seuil achat")
+        ax_sent.axhline(cfg.fng_sell_threshold, color="#d7263d", linestyle="--", linewidth=1, label="Seuil vente")
     ax_sent.axhline(50, color="#888", linestyle="--", linewidth=1, alpha=0.4)
     ax_sent.fill_between(d["date"], d["fng"], 0, where=d["pos"] > 0, color="#18a957", alpha=0.05)
     ax_sent.set_ylabel("FNG")
@@ -85,6 +96,19 @@ def plot_overview(d: pd.DataFrame, cfg: StrategyConfig | None, title: str = "",
     axes[2].set_ylabel("Equity (start=1)")
     axes[2].legend(loc="upper left")
 
+    # Métriques glissantes
+    if rolling:
+        roll = rolling_metrics(d, window=rolling)
+        ax_roll = axes[3]
+        ax_roll.plot(d["date"], roll["rolling_sharpe"], label=f"Sharpe {rolling}j", color="#2d6cdf")
+        ax_roll.axhline(0, color="#888", linestyle="--", linewidth=1, alpha=0.4)
+        ax_roll.set_ylabel("Sharpe glissant")
+        ax_dd = ax_roll.twinx()
+        ax_dd.fill_between(d["date"], roll["rolling_maxdd"] * 100, 0, color="#d7263d", alpha=0.15, label=f"Max DD {rolling}j (%)")
+        ax_dd.set_ylabel("Max DD glissant (%)")
+        ax_roll.legend(loc="upper left")
+        ax_dd.legend(loc="lower right")
+
     fig.suptitle(title or "BTC strategy: FNG (régime) + Rainbow (sizing)")
     fig.tight_layout()
     if out:
@@ -13,9 +13,7 @@ from fngbt import (
     build_signals,
     default_search_space,
     grid_search_full,
-    load_btc_prices,
-    load_fng_alt,
-    merge_daily,
+    load_all,
     optuna_search,
     plot_overview,
     run_backtest,
@@ -28,16 +26,12 @@ st.set_page_config(page_title="BTC FNG -> Rainbow sizing", layout="wide")
 
 @st.cache_data(show_spinner=True, ttl=12 * 3600)
 def load_data(weekly: bool, lookback_years: float | None):
-    fng = load_fng_alt()
-    px = load_btc_prices(start=fng["date"].min())
-    df = merge_daily(fng, px)
+    df = load_all()
     if weekly:
         df = to_weekly(df, how="last")
     if lookback_years:
         cutoff = df["date"].max() - pd.Timedelta(days=int(lookback_years * 365))
         df = df[df["date"] >= cutoff].reset_index(drop=True)
-    if "fng" in df.columns:
-        df["ema200_soft"] = df["fng"].ewm(span=200, adjust=False).mean()
     return df
 
 
@@ -2,12 +2,57 @@
 """
 Test simple de la stratégie avec des données synthétiques
 """
+import io
+import json
+import tempfile
+import threading
+import time
+import warnings
+from contextlib import contextmanager, redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from pathlib import Path
 
-from src.fngbt.strategy import StrategyConfig, build_signals
-from src.fngbt.backtest import run_backtest
+from src.fngbt import data as data_mod
+from src.fngbt.data import (
+    ResamplePyramid,
+    append_daily,
+    append_weekly,
+    download_btc_prices,
+    load_all,
+    load_btc_prices,
+    load_fng_alt,
+    load_snapshot,
+    merge_daily,
+    read_price_csv,
+    resample,
+    to_weekly,
+    write_snapshot,
+)
+from src.fngbt.strategy import (
+    FeatureFrame,
+    RAINBOW_QUANTILES,
+    StrategyConfig,
+    StrategyState,
+    build_positions_batch,
+    build_signals,
+    build_signals_lean,
+    calculate_rainbow_position,
+    filter_min_change,
+    filter_min_change_batch,
+    fng_level_score,
+    score_table,
+)
+from src.fngbt.backtest import backtest_arrays, run_backtest, run_backtest_batch
+from src.fngbt.quality import DEFAULT_MAX_GAP_DAYS, check_quality, fill_gaps, quality_gate
+from src.fngbt.metrics import MetricsAccumulator, compute_metrics, compute_metrics_batch
+from src.fngbt.optimize import evaluate_config, grid_search, walk_forward_cv
+from src.fngbt.montecarlo import bootstrap_indices, monte_carlo
+from src.fngbt.rolling import rolling_max_drawdown, rolling_metrics, rolling_std
 
 
 def generate_test_data(n_days=1000):
@@ -32,6 +77,728 @@ def generate_test_data(n_days=1000):
     })
 
 
+def _coingecko_points(lo: int, hi: int) -> list:
+    """
+    Points CoinGecko dans [lo, hi] (secondes) : close = jour depuis epoch.
+
+    Comme l'API réelle, un intervalle de moins de 90 jours renvoie des points
+    horaires (à hh:30, close fractionnaire) au lieu d'un point par jour à 00:00 UTC.
+    """
+    if hi - lo < 90 * 86400:
+        first = -(-lo // 3600) * 3600 + 1800
+        return [[t * 1000, t / 86400] for t in range(first, hi + 1, 3600)]
+    first = -(-lo // 86400) * 86400
+    return [[t * 1000, t / 86400] for t in range(first, hi + 1, 86400)]
+
+
+@contextmanager
+def coingecko_stub_server(fail_first: bool = True):
+    """
+    Faux serveur CoinGecko local (market_chart/range) pour tester hors-ligne.
+
+    Un prix par jour à 00:00 UTC (close = jour depuis epoch) ; la première requête
+    de chaque fenêtre (valeur de `from`) répond 429 pour exercer le retry, de façon
+    déterministe quel que soit l'ordre des requêtes concurrentes.
+    """
+    state = {"calls": 0, "throttled": 0}
+    seen: set[str] = set()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            qs = parse_qs(urlparse(self.path).query)
+            with lock:
+                state["calls"] += 1
+                fail = fail_first and qs["from"][0] not in seen
+                seen.add(qs["from"][0])
+                state["throttled"] += fail
+            if fail:
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            prices = _coingecko_points(int(qs["from"][0]), int(qs["to"][0]))
+            body = json.dumps({"prices": prices}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/range", state
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class _StubResponse:
+    def __init__(self, status_code: int, payload=None):
+        self.status_code = status_code
+        self.headers = {}
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise data_mod.requests.HTTPError(f"{self.status_code}")
+
+
+@contextmanager
+def stub_http(handler):
+    """
+    Remplace la session HTTP partagée de `fngbt.data` : `handler(url, params)`
+    renvoie (status, payload). Les appels sont enregistrés dans la liste produite.
+    """
+    calls = []
+
+    class Session:
+        def get(self, url, params=None, timeout=None):
+            calls.append((url, dict(params or {})))
+            return _StubResponse(*handler(url, params or {}))
+
+    saved = data_mod._SESSION
+    data_mod._SESSION = Session()
+    try:
+        yield calls
+    finally:
+        data_mod._SESSION = saved
+
+
+def _stub_fng(url, params):
+    """alternative.me : les `limit` derniers jours jusqu'à aujourd'hui (fng = jour du mois)."""
+    days = pd.date_range(end=data_mod._today_utc(), periods=int(params["limit"]) or 400, freq="D")
+    rows = [{"timestamp": str(int(d.timestamp())), "value": str(d.day)} for d in days[::-1]]
+    return 200, {"data": rows}
+
+
+def _stub_prices(url, params):
+    return 200, {"prices": _coingecko_points(int(params["from"]), int(params["to"]))}
+
+
+def _not_found(url, params):
+    return 404, None
+
+
+def test_data_cache():
+    """Cache local : complément tête/queue, lecture offline, repli sur le cache"""
+    today = data_mod._today_utc()
+    epoch_days = lambda d: (d - pd.Timestamp("1970-01-01")).days
+    with tempfile.TemporaryDirectory() as tmp:
+        # FNG : seule la queue manquante est re-téléchargée
+        old = pd.date_range(end=today - pd.Timedelta(days=10), periods=50, freq="D")
+        data_mod._write_cache(pd.DataFrame({"date": old, "fng": -1.0}), data_mod._cache_path(tmp, "fng"))
+        with stub_http(_stub_fng) as calls:
+            fng = load_fng_alt(cache_dir=tmp)
+        assert [c[1]["limit"] for c in calls] == [12]
+        assert fng["date"].tolist() == pd.date_range(old[0], today, freq="D").tolist()
+        assert (fng["fng"].iloc[:40] == -1).all() and (fng["fng"].iloc[-11:] == fng["date"].dt.day.iloc[-11:]).all()
+
+        # Prix : tête et queue manquantes téléchargées, le milieu vient du cache
+        mid = pd.date_range(today - pd.Timedelta(days=300), today - pd.Timedelta(days=5), freq="D")
+        data_mod._write_cache(pd.DataFrame({"date": mid, "close": -1.0}), data_mod._cache_path(tmp, "btc_usd"))
+        start = today - pd.Timedelta(days=400)
+        with stub_http(_stub_prices) as calls:
+            px = load_btc_prices(start=start, cache_dir=tmp)
+        froms = sorted(pd.Timestamp(int(c[1]["from"]), unit="s") for c in calls)
+        # Queue de 6 jours élargie à 91 jours (granularité journalière chez CoinGecko)
+        assert froms == [start, today + pd.Timedelta(days=1 - 91)]
+        assert px["date"].tolist() == pd.date_range(start, today + pd.Timedelta(days=1), freq="D").tolist()
+        inside = px["date"].between(mid[1], mid[-2])
+        assert (px.loc[inside, "close"] == -1).all()
+        assert np.allclose(px.loc[~inside, "close"], px.loc[~inside, "date"].map(epoch_days))
+
+        # Offline : lecture du cache sans aucun appel réseau
+        with stub_http(_not_found) as calls:
+            assert load_fng_alt(cache_dir=tmp, offline=True).equals(fng)
+            assert len(load_btc_prices(start=start, cache_dir=tmp, offline=True)) == len(px)
+            # Source en échec → repli sur le cache avec un avertissement
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                data_mod._write_cache(fng.iloc[:-3], data_mod._cache_path(tmp, "fng"))
+                assert len(load_fng_alt(cache_dir=tmp)) == len(fng) - 3
+            assert any("cache local" in str(w.message) for w in caught)
+        assert len(calls) == 1
+
+        # Offline sans cache : erreur explicite, jamais de téléchargement
+        with stub_http(_stub_fng) as calls:
+            for fn in (lambda: load_fng_alt(cache_dir=None, offline=True),
+                       lambda: load_btc_prices(cache_dir=None, offline=True),
+                       lambda: load_fng_alt(cache_dir=Path(tmp) / "vide", offline=True)):
+                try:
+                    fn()
+                except RuntimeError:
+                    pass
+                else:
+                    raise AssertionError("offline sans cache doit lever une erreur")
+        assert calls == []
+
+
+def _memmap_backed(arr: np.ndarray) -> bool:
+    while arr is not None:
+        if isinstance(arr, np.memmap):
+            return True
+        arr = getattr(arr, "base", None)
+    return False
+
+
+def test_snapshot_roundtrip():
+    """Snapshot colonnaire : relecture identique, colonnes memmap en lecture seule, version stable"""
+    df = generate_test_data(500)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_snapshot(df, tmp)
+        assert (Path(tmp) / "LATEST").read_text() == path.name
+        assert write_snapshot(df, tmp) == path
+        assert not list(Path(tmp).glob(".*.tmp"))
+
+        snap = load_snapshot(tmp)
+        pd.testing.assert_frame_equal(snap, df)
+        for col in df.columns:
+            arr = snap[col].to_numpy()
+            assert _memmap_backed(arr) and not arr.flags.writeable
+        assert not _memmap_backed(load_snapshot(tmp, version=path.name, mmap=False)["close"].to_numpy())
+
+        # Un dataset différent → nouvelle version, LATEST suit
+        path2 = write_snapshot(df.iloc[:-1], tmp)
+        assert path2 != path and load_snapshot(tmp)["date"].iloc[-1] == df["date"].iloc[-2]
+        pd.testing.assert_frame_equal(load_snapshot(tmp, version=path.name), df)
+
+        # Rotation : seules les `keep` versions les plus récentes restent sur disque
+        path3 = write_snapshot(df.iloc[:-2], tmp, keep=2)
+        assert sorted(p.name for p in Path(tmp).iterdir() if p.is_dir()) == sorted([path2.name, path3.name])
+        assert write_snapshot(df.iloc[:-1], tmp, keep=1) == path2  # réécriture → plus récente
+        assert [p.name for p in Path(tmp).iterdir() if p.is_dir()] == [path2.name]
+        assert (Path(tmp) / "LATEST").read_text() == path2.name
+
+
+def test_load_all_timeout():
+    """load_all : budget global respecté, repli sur le cache, threads daemon, pas de secours → erreur"""
+    release = threading.Event()
+    pending = []
+
+    def hanging(url, params):
+        release.wait(10)
+        return 404, None
+
+    today = data_mod._today_utc()
+    days = pd.date_range(end=today - pd.Timedelta(days=5), periods=100, freq="D")
+    with tempfile.TemporaryDirectory() as tmp, stub_http(hanging), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        try:
+            data_mod._write_cache(pd.DataFrame({"date": days, "fng": 50.0}), data_mod._cache_path(tmp, "fng"))
+            data_mod._write_cache(pd.DataFrame({"date": days, "close": 1.0}), data_mod._cache_path(tmp, "btc_usd"))
+            t0 = time.monotonic()
+            df = load_all(start=days[0], cache_dir=tmp, timeout=0.2)
+            assert time.monotonic() - t0 < 2.0
+            assert df["date"].tolist() == days.tolist()
+            pending = [t for t in threading.enumerate() if t.name.startswith("fngbt-")]
+            assert pending and all(t.daemon for t in pending)
+
+            # Sans cache ni CSV : erreur explicite, sans téléchargement synchrone
+            t0 = time.monotonic()
+            try:
+                load_all(cache_dir=None, timeout=0.2)
+            except RuntimeError:
+                pass
+            else:
+                raise AssertionError("load_all sans source de secours doit lever une erreur")
+            assert time.monotonic() - t0 < 2.0
+        finally:
+            release.set()
+            for t in pending:
+                t.join(5)
+
+
+def test_append_daily():
+    """Ajouts incrémentaux quotidiens = reconstruction complète, même si un prix arrive en retard"""
+    df = generate_test_data(260)
+    fng = df[["date"]].assign(fng=df["fng"].round().astype("int64"))
+    px = df[["date", "close"]]
+    merged, pending = merge_daily(fng.iloc[:200], px.iloc[:200]), None
+    weekly = to_weekly(merged)
+    fng_seen, px_seen = [fng.iloc[:200]], [px.iloc[:200]]
+    late = None
+    for k in range(200, 260):
+        f_new, p_new = fng.iloc[[k]], px.iloc[[k]]
+        if late is not None:  # prix de la veille arrivé avec un appel de retard
+            p_new, late = pd.concat([late, p_new]), None
+        if k % 7 == 3:
+            p_new, late = p_new.iloc[:-1], p_new.iloc[-1:]
+        if k == 230:  # correction d'un prix déjà fusionné, sans FNG
+            p_new = pd.concat([p_new, px.iloc[[210]].assign(close=lambda d: d["close"] * 1.01)])
+        fng_seen.append(f_new)
+        px_seen.append(p_new)
+
+        merged, first, pending = append_daily(merged, f_new, p_new, pending)
+        weekly, _ = append_weekly(weekly, merged, first)
+        full = merge_daily(
+            pd.concat(fng_seen).drop_duplicates("date", keep="last"),
+            pd.concat(px_seen).drop_duplicates("date", keep="last"),
+        )
+        pd.testing.assert_frame_equal(merged, full)
+        pd.testing.assert_frame_equal(weekly, to_weekly(full))
+        assert len(pending) == (late is not None)
+
+
+def test_resample():
+    """Ré-échantillonnage sans look-ahead (datée en fin de période) + pyramide de résolutions"""
+    df = generate_test_data(400)
+    daily = df.set_index("date")
+    for freq in ("3D", "W-FRI", "M"):
+        out = resample(df, freq)
+        # Chaque ligne porte le dernier close / FNG observé à sa date, jamais un futur
+        asof = daily.reindex(out["date"], method="ffill")
+        assert np.allclose(out["close"], asof["close"]) and np.allclose(out["fng"], asof["fng"])
+        assert out["date"].is_monotonic_increasing and out["date"].iloc[-1] >= df["date"].iloc[-1]
+    assert (resample(df, "W-FRI")["date"].dt.dayofweek == 4).all()
+    assert resample(df, "M")["date"].dt.is_month_end.all()
+    weekly_mean = resample(df, "W-FRI", fng_how="mean")
+    expected = daily["fng"].groupby(pd.offsets.Week(weekday=4).rollforward).mean()
+    assert np.allclose(weekly_mean["fng"], expected.to_numpy())
+    pd.testing.assert_frame_equal(resample(df, "D"), df[["date", "fng", "close"]])
+
+    pyr = ResamplePyramid(df.sample(frac=1.0, random_state=0))
+    levels = pyr.build()
+    assert list(levels) == list(ResamplePyramid.DEFAULT_LEVELS)
+    for freq, level in levels.items():
+        pd.testing.assert_frame_equal(level, resample(df, freq))
+    assert pyr.get("ME") is levels["M"] and pyr.get("W-FRI") is levels["W-FRI"]
+    assert pyr.get("W-FRI", fng_how="mean") is not levels["W-FRI"]
+
+
+def _raises_value_error(fn) -> bool:
+    try:
+        fn()
+    except ValueError:
+        return True
+    return False
+
+
+def test_quality():
+    """Contrôle qualité : diagnostic, comblement des trous et garde-fou aux points d'entrée"""
+    clean = generate_test_data(120)
+    rep = check_quality(clean)
+    assert rep.ok and rep.max_gap_days == 1 and rep.rows == 120
+    assert quality_gate(clean).rows == 120
+
+    bad = clean.copy()
+    bad.loc[40, "fng"] = np.nan
+    bad.loc[60:, "close"] *= 2.0                                # saut de prix (log 2 > 0.3)
+    bad.loc[70:75, "fng"] = 33.0                                # FNG figé 6 jours
+    bad = bad.drop(index=range(10, 15))                         # trou de 6 jours
+    bad = pd.concat([bad, bad.loc[[30]]], ignore_index=True)    # date dupliquée
+    rep = check_quality(bad)
+    assert not rep.ok
+    assert (rep.missing_days, rep.dup_dates, rep.max_gap_days) == (5, 1, 6)
+    assert rep.nan_counts == {"fng": 1, "close": 0}
+    assert rep.gaps["gap_days"].tolist() == [6]
+    assert clean["date"].iloc[60] in rep.jumps.loc[rep.jumps["col"] == "close", "date"].tolist()
+    assert rep.stale.loc[rep.stale["col"] == "fng", "length"].max() == 6
+
+    filled = fill_gaps(bad, policy="ffill")
+    assert filled["date"].tolist() == clean["date"].tolist()
+    assert (filled.loc[10:14, "close"] == clean.loc[9, "close"]).all()
+    inter = fill_gaps(bad, policy="interpolate")
+    assert np.isclose(inter.loc[12, "close"], (clean.loc[9, "close"] + clean.loc[15, "close"]) / 2)
+    dropped = fill_gaps(bad, policy="drop")
+    assert len(dropped) == 120 - 5 - 1 and dropped["date"].is_unique
+    assert _raises_value_error(lambda: fill_gaps(bad, policy="zero"))
+
+    # Garde-fou : doublons, NaN, trous (seuil suivant la résolution), sauts optionnels
+    assert _raises_value_error(lambda: quality_gate(bad))
+    assert quality_gate(clean.drop(index=range(10, 15))).missing_days == 5  # trou de 6 ≤ défaut
+    assert _raises_value_error(lambda: quality_gate(clean.drop(index=range(10, 20))))
+    assert quality_gate(clean.drop(index=range(10, 20)), max_gap_days=11).missing_days == 10
+    assert quality_gate(to_weekly(clean)).max_gap_days == 7
+    jumpy = clean.assign(close=np.where(clean.index >= 60, clean["close"] * 2, clean["close"]))
+    assert quality_gate(jumpy).jumps.shape[0] == 1
+    assert _raises_value_error(lambda: quality_gate(jumpy, allow_jumps=False))
+
+    # Points d'entrée : même seuil par défaut partout, données invalides refusées
+    holed = clean.drop(index=range(10, 20))
+    for entry in (
+        lambda d, **kw: quality_gate(d, **kw),
+        lambda d, **kw: run_backtest(build_signals(d, StrategyConfig()), **kw),
+        lambda d, **kw: evaluate_config(d, StrategyConfig(), 10.0, **kw),
+        lambda d, **kw: evaluate_config(d, StrategyConfig(), 10.0, lean=True, **kw),
+        lambda d, **kw: grid_search(d, {"fng_buy_threshold": [25]}, use_walk_forward=False, **kw),
+    ):
+        assert _raises_value_error(lambda: entry(holed))
+        with redirect_stdout(io.StringIO()):
+            entry(holed, max_gap_days=DEFAULT_MAX_GAP_DAYS + 4)
+    space = {"fng_buy_threshold": [25]}
+    assert _raises_value_error(lambda: grid_search(bad, space, use_walk_forward=False))
+    signals = build_signals(clean, StrategyConfig())
+    dup = pd.concat([signals, signals.iloc[[5]]], ignore_index=True)
+    assert _raises_value_error(lambda: run_backtest(dup))
+    assert run_backtest(dup, max_gap_days=None)["metrics"]["Days"] == 121
+
+
+def test_read_price_csv():
+    """CSV intraday lu par blocs : décimales tardives (après des prix entiers) et agrégat journalier OHLC"""
+    ts = pd.date_range("2020-01-01", periods=24 * 120, freq="h")
+    close = np.arange(len(ts), dtype=float) + 10_000.0
+    close[len(ts) // 2:] += 0.25  # décimales uniquement en fin de fichier
+    raw = pd.DataFrame({"date": ts.strftime("%Y-%m-%dT%H:%M:%SZ"), "open": close, "high": close + 1,
+                        "low": close - 1, "close": close})
+    expected = pd.DataFrame({"close": close, "open": close, "high": close + 1, "low": close - 1}, index=ts)
+    expected = expected.groupby(ts.normalize()).agg(
+        {"open": "first", "high": "max", "low": "min", "close": "last"}).rename_axis("date").reset_index()
+
+    saved = data_mod._ARROW_BLOCK_SIZE
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "btc_1h.csv"
+        raw.to_csv(path, index=False, float_format="%g")
+        data_mod._ARROW_BLOCK_SIZE = 16 << 10  # plusieurs blocs pyarrow
+        try:
+            px = read_price_csv(path, ohlc=True, chunk_rows=1000)
+        finally:
+            data_mod._ARROW_BLOCK_SIZE = saved
+    pd.testing.assert_frame_equal(px, expected, check_dtype=False, check_index_type=False)
+    assert px["close"].dtype == np.float64
+
+    # Dates dupliquées (même horodatage) : la première ligne du fichier est gardée,
+    # y compris quand le doublon tombe dans un autre bloc
+    days = pd.date_range("2020-01-01", periods=2000, freq="D")
+    daily = pd.DataFrame({"date": days.strftime("%Y-%m-%d"), "close": np.arange(2000) + 1.5})
+    dups = daily.iloc[[10, 1500]].assign(close=-1.0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "btc_1d.csv"
+        pd.concat([daily.iloc[:11], dups.iloc[[0]], daily.iloc[11:], dups.iloc[[1]]]).to_csv(path, index=False)
+        data_mod._ARROW_BLOCK_SIZE = 4 << 10
+        try:
+            px = read_price_csv(path, chunk_rows=500)
+            loaded = load_btc_prices(start="2020-01-01", end=days[-1], csv_path=path)
+        finally:
+            data_mod._ARROW_BLOCK_SIZE = saved
+    assert px["date"].tolist() == days.tolist() and (px["close"] > 0).all()
+    pd.testing.assert_frame_equal(loaded, px)
+
+
+def test_coingecko_downloader():
+    """Téléchargement par fenêtres : couverture complète, sans doublon, malgré les 429"""
+    with coingecko_stub_server() as (url, state):
+        px = download_btc_prices("2016-01-01", "2020-12-31", url=url, window_days=120, backoff=0.0)
+    expected = pd.date_range("2016-01-01", "2020-12-31", freq="D")
+    assert px["date"].tolist() == expected.tolist()
+    assert np.allclose(px["close"], (expected - pd.Timestamp("1970-01-01")).days)
+    assert state["throttled"] > 1 and state["calls"] == 2 * state["throttled"]
+
+    # Intervalle court (mise à jour de queue) : toujours des clôtures journalières
+    with coingecko_stub_server(fail_first=False) as (url, state):
+        px = download_btc_prices("2020-12-20 06:00", "2020-12-31", url=url, backoff=0.0)
+    expected = pd.date_range("2020-12-20", "2020-12-31", freq="D")
+    assert px["date"].tolist() == expected.tolist()
+    assert np.allclose(px["close"], (expected - pd.Timestamp("1970-01-01")).days)
+    assert state["calls"] == 1
+
+
+def test_indicator_cache_index():
+    """Cache d'indicateurs : même données, index différent → valeurs alignées sur l'index de l'appelant"""
+    df = generate_test_data(600)
+    sliced = df.iloc[100:500]
+    rebased = sliced.reset_index(drop=True)
+    for frame in (sliced, rebased):  # le premier appel remplit le cache
+        feats = FeatureFrame(frame).features("full")
+        assert len(feats) == 400 and feats.index.equals(frame.index)
+        assert not feats["rainbow_position"].isna().any()
+        sig = build_signals(frame, StrategyConfig(fng_source_col="fng_ema20"))
+        assert len(sig) == 400 and not sig["fng_used"].isna().any()
+    pd.testing.assert_frame_equal(
+        FeatureFrame(rebased).features("full"),
+        FeatureFrame(sliced).features("full").reset_index(drop=True),
+    )
+
+
+def test_features_existing_rainbow_columns():
+    """Un frame qui porte déjà des colonnes Rainbow (sortie de build_signals) : recalculées, sans doublon"""
+    df = generate_test_data(800)
+    stale = build_signals(df, StrategyConfig(rainbow_model="quantile"))  # rainbow_band_*, rainbow_base...
+    for model in ("full", "expanding", "quantile"):
+        cfg = StrategyConfig(rainbow_model=model)
+        ref = build_signals(df, cfg)
+        for frame in (stale, stale[["date", "fng", "close", "rainbow_position"]]):
+            ff = FeatureFrame(frame)
+            assert not ff.features(model).columns.duplicated().any()
+            sig = build_signals(ff, cfg)
+            assert not sig.columns.duplicated().any()
+            assert np.allclose(sig["rainbow_position"], ref["rainbow_position"])
+            assert np.array_equal(sig["pos"].to_numpy(), ref["pos"].to_numpy())
+            assert np.array_equal(build_signals_lean(ff, cfg, dtype=np.float64).pos, ref["pos"].to_numpy())
+            assert np.array_equal(build_positions_batch(ff, [cfg])[0], ref["pos"].to_numpy())
+    expected = evaluate_config(df, StrategyConfig(), 10.0)["metrics"]
+    assert evaluate_config(stale, StrategyConfig(), 10.0)["metrics"] == expected
+
+
+def test_min_change_filter():
+    """Le noyau d'hystérésis (simple et batch) reproduit exactement la boucle de référence"""
+    rng = np.random.default_rng(0)
+    pos_raw = np.clip(np.cumsum(rng.normal(0, 4, (20, 1500)), axis=1) + 50, 0, 100)
+    min_changes = rng.choice([0.0, 5.0, 10.0, 20.0], len(pos_raw))
+    batch = filter_min_change_batch(pos_raw, min_changes)
+    for row, m, got in zip(pos_raw, min_changes, batch):
+        expected, current_pos = [], 0.0
+        for target in row:
+            if abs(target - current_pos) >= m:
+                current_pos = target
+            expected.append(current_pos)
+        assert np.array_equal(filter_min_change(row, m), expected)
+        assert np.array_equal(got, expected)
+
+
+def test_batch_positions():
+    """Les moteurs batch (N configs) et léger donnent les mêmes positions que build_signals"""
+    features = FeatureFrame(generate_test_data(n_days=800))
+    cfgs = [
+        StrategyConfig(),
+        StrategyConfig(fng_buy_threshold=35, fng_sell_threshold=65, rainbow_buy_threshold=0.4),
+        StrategyConfig(max_allocation_pct=80, min_allocation_pct=10, min_position_change_pct=15.0),
+        StrategyConfig(rainbow_sell_threshold=0.8, execute_next_day=False),
+    ]
+    pos = build_positions_batch(features, cfgs)
+    for cfg, row in zip(cfgs, pos):
+        full = build_signals(features, cfg)
+        lean = build_signals_lean(features, cfg, dtype=np.float64)
+        assert np.array_equal(full["pos"].to_numpy(), row)
+        assert np.array_equal(lean.pos, row)
+        assert np.array_equal(lean.trade, full["trade"].to_numpy())
+
+
+def test_fng_levels():
+    """Paliers FNG: escalier attendu, table 0-100 (FNG entier) = calcul direct, live cohérent"""
+    score = fng_level_score(np.array([10, 25, 50, 75, 90, np.nan]), [25], [75])
+    assert np.allclose(score[:5], [1.0, 1.0, 0.5, 0.0, 0.0]) and np.isnan(score[5])
+
+    df = generate_test_data(n_days=800)
+    df["fng"] = df["fng"].round()  # FNG entier → lecture par table
+    cfgs = [
+        StrategyConfig(fng_buy_levels=(15, 25, 35), fng_sell_levels=(60, 70, 80)),
+        StrategyConfig(fng_buy_levels=(20,), rainbow_model="expanding"),
+        StrategyConfig(),
+    ]
+    for data in (df, generate_test_data(n_days=800)):  # entier puis lissé (non entier)
+        features = FeatureFrame(data)
+        for cfg, row in zip(cfgs, build_positions_batch(features, cfgs)):
+            assert np.array_equal(build_signals(features, cfg)["pos"].to_numpy(), row)
+
+    cfg = cfgs[1]
+    state = StrategyState.from_history(df.iloc[:400], cfg)
+    targets = [state.update(r.date, r.fng, r.close) for r in df.iloc[400:].itertuples()]
+    assert np.allclose(targets, build_signals(df, cfg)["pos_target"].iloc[400:], atol=1e-9)
+
+
+def test_allocation_table():
+    """Table 101 × K partagée entre bornes d'allocation, identique au calcul jour par jour"""
+    df = generate_test_data(n_days=800)
+    df["fng"] = df["fng"].round()
+    features = FeatureFrame(df)
+    cfgs = [
+        StrategyConfig(rainbow_buckets=40, max_allocation_pct=hi, min_allocation_pct=lo)
+        for lo, hi in ((0, 100), (10, 80), (20, 60))
+    ] + [StrategyConfig(rainbow_buckets=40, rainbow_model="expanding", fng_buy_levels=(10, 20))]
+    assert score_table(cfgs[0]) is score_table(cfgs[2])
+    for cfg, row in zip(cfgs, build_positions_batch(features, cfgs)):
+        assert np.array_equal(build_signals(features, cfg)["pos"].to_numpy(), row)
+        assert np.array_equal(build_signals_lean(features, cfg, dtype=np.float64).pos, row)
+
+
+def test_backtest_kernel():
+    """Noyau fusionné = métriques pandas (compute_metrics) du DataFrame journalier, y compris sur [start:]"""
+    signals = build_signals(generate_test_data(n_days=800), StrategyConfig())
+    result = run_backtest(signals, fees_bps=10.0)
+    for start in (0, 500):
+        fast = backtest_arrays(signals["close"], signals["pos"], fees_bps=10.0, start=start)
+        ref = compute_metrics(result["df"].iloc[start:])
+        ref["trades"] = int(result["df"]["trade"].iloc[start:].sum())
+        for key, value in ref.items():
+            assert np.isclose(fast[key], value, rtol=1e-9, atol=1e-12), key
+    assert run_backtest(signals, daily=False)["df"] is None
+
+
+def test_backtest_batch():
+    """Backtest batch par blocs (matrice ou générateur) = noyau simple ligne par ligne"""
+    features = FeatureFrame(generate_test_data(n_days=800))
+    cfgs = [StrategyConfig(fng_buy_threshold=b, min_position_change_pct=m) for b in (15, 25, 35) for m in (5.0, 20.0)]
+    close = features.raw["close"].to_numpy()
+    pos = build_positions_batch(features, cfgs)
+    by_matrix = run_backtest_batch(close, pos, fees_bps=10.0, chunk_rows=4)
+    by_chunks = run_backtest_batch(close, (pos[i:i + 2] for i in range(0, len(pos), 2)), fees_bps=10.0)
+    for i, row in enumerate(pos):
+        ref = backtest_arrays(close, row, fees_bps=10.0)
+        for key, value in ref.items():
+            assert np.isclose(by_matrix[key].iloc[i], value, rtol=1e-12), key
+            assert np.isclose(by_chunks[key].iloc[i], value, rtol=1e-12), key
+
+
+def test_monte_carlo():
+    """Bootstrap par blocs: blocs consécutifs, résultats reproductibles quel que soit le nb de threads"""
+    idx = bootstrap_indices(100, n_paths=3, n_days=50, block_len=10, method="block", rng=np.random.default_rng(0))
+    steps = np.diff(idx, axis=1) % 100
+    assert (np.delete(steps, np.arange(9, 49, 10), axis=1) == 1).all()
+
+    features = FeatureFrame(generate_test_data(n_days=800))
+    one = monte_carlo(features, StrategyConfig(), n_paths=300, chunk_paths=100, max_workers=1, seed=7)
+    many = monte_carlo(features, StrategyConfig(), n_paths=300, chunk_paths=100, max_workers=3, seed=7)
+    assert len(one.metrics) == 300 and one.metrics.equals(many.metrics)
+    lo, hi = one.ci("score")
+    assert 0 < lo <= hi
+
+
+def test_metrics_accumulator():
+    """Accumulateur en flux (jour par jour ou segments fusionnés) = métriques du backtest complet"""
+    signals = build_signals(generate_test_data(n_days=800), StrategyConfig())
+    result = run_backtest(signals, fees_bps=10.0)
+    d = result["df"]
+    cols = (d["strategy_ret"].to_numpy(), d["ret"].to_numpy(), d["turnover"].to_numpy(), d["pos"].to_numpy() / 100)
+
+    daily = MetricsAccumulator()
+    for values in zip(*cols):
+        daily.update(*values)
+    cuts = [0, 1, 250, 600, 800]
+    merged = MetricsAccumulator()
+    for start, stop in zip(cuts[:-1], cuts[1:]):
+        merged = merged.merge(MetricsAccumulator.from_arrays(*(c[start:stop] for c in cols)))
+
+    for acc in (daily, merged):
+        for key, value in result["metrics"].items():
+            assert np.isclose(acc.metrics()[key], value, rtol=1e-9), key
+
+
+def test_compute_metrics_batch():
+    """Métriques vectorisées (N × jours) = compute_metrics ligne par ligne"""
+    df = generate_test_data(n_days=800)
+    results = [
+        run_backtest(build_signals(df, StrategyConfig(fng_buy_threshold=b, min_position_change_pct=m)))
+        for b in (15, 30) for m in (5.0, 20.0)
+    ]
+    sr = np.stack([r["df"]["strategy_ret"].to_numpy() for r in results])
+    turnover = np.stack([r["df"]["turnover"].to_numpy() for r in results])
+    batch = compute_metrics_batch(sr, turnover=turnover, ret=results[0]["df"]["ret"].to_numpy())
+    for i, r in enumerate(results):
+        for key, value in r["metrics"].items():
+            if key in batch:
+                assert np.isclose(batch[key][i], value, rtol=1e-9), key
+
+
+def test_rolling_metrics():
+    """Métriques glissantes O(n) = calcul naïf (pandas rolling / fenêtre par fenêtre)"""
+    signals = build_signals(generate_test_data(n_days=800), StrategyConfig())
+    d = run_backtest(signals, fees_bps=10.0)["df"]
+    window = 90
+    roll = rolling_metrics(d, window=window)
+    assert len(roll) == len(d) and roll["rolling_sharpe"].iloc[: window - 1].isna().all()
+    ref_std = d["strategy_ret"].rolling(window).std()
+    assert np.allclose(rolling_std(d["strategy_ret"], window), ref_std, equal_nan=True)
+
+    equity = np.stack([d["equity"].to_numpy(), d["bh_equity"].to_numpy()])
+    fast = rolling_max_drawdown(equity, window, min_periods=1)
+    for row, eq in zip(fast, equity):
+        naive = [
+            (seg / np.maximum.accumulate(seg) - 1).min()
+            for seg in (eq[max(0, t - window + 1): t + 1] for t in range(len(eq)))
+        ]
+        assert np.allclose(row, naive)
+
+
+def test_walk_forward_prefix():
+    """Walk-forward en mode prefix: folds = métriques du segment de test du backtest complet"""
+    features = FeatureFrame(generate_test_data(n_days=1200))
+    cfg = StrategyConfig()
+    wf = walk_forward_cv(features, cfg, fees_bps=10.0, mode="prefix")
+    full = run_backtest(build_signals(features, cfg), fees_bps=10.0)
+    assert wf["full_metrics"]["EquityFinal"] == full["metrics"]["EquityFinal"]
+    d = full["df"]
+    for fold in wf["folds"]:
+        seg = slice(fold["test_start"], fold["test_end"])
+        ref = MetricsAccumulator.from_arrays(d["strategy_ret"][seg], d["ret"][seg], d["turnover"][seg]).metrics()
+        for key, value in fold["metrics"].items():
+            if key in ref:
+                assert np.isclose(value, ref[key], rtol=1e-9), key
+
+
+def test_rainbow_quantile():
+    """Rainbow v2 (quantiles) : bandes croissantes, indice et position bornés, moteurs cohérents"""
+    df = generate_test_data(n_days=800)
+    d = calculate_rainbow_position(df, model="quantile")
+    band_cols = [f"rainbow_band_{int(round(q * 100)):02d}" for q in RAINBOW_QUANTILES]
+    bands = d[band_cols].to_numpy()
+    assert (np.diff(bands, axis=1) > 0).all()
+    assert np.allclose(d["rainbow_min"], bands[:, 0]) and np.allclose(d["rainbow_max"], bands[:, -1])
+
+    band = d["rainbow_band"].to_numpy()
+    assert ((band >= 0) & (band <= len(RAINBOW_QUANTILES))).all() and len(np.unique(band)) > 2
+    assert ((band / len(RAINBOW_QUANTILES) >= 0) & (band / len(RAINBOW_QUANTILES) <= 1)).all()
+    pos = d["rainbow_position"].to_numpy()
+    assert ((pos >= 0) & (pos <= 1)).all() and pos.min() == 0.0 and pos.max() == 1.0
+    # Position interpolée à l'intérieur de sa bande ; sous/au-dessus des bandes extrêmes → 0 / 1
+    k = np.clip(band, 1, len(RAINBOW_QUANTILES) - 1)
+    span = len(RAINBOW_QUANTILES) - 1
+    assert ((pos >= (k - 1) / span - 1e-12) & (pos <= k / span + 1e-12)).all()
+    assert (pos[d["close"] <= d["rainbow_min"]] == 0).all() and (pos[d["close"] >= d["rainbow_max"]] == 1).all()
+
+    features = FeatureFrame(df)
+    cfgs = [
+        StrategyConfig(rainbow_model="quantile"),
+        StrategyConfig(rainbow_model="quantile", rainbow_buy_threshold=0.4, min_position_change_pct=15.0),
+        StrategyConfig(rainbow_model="quantile", rainbow_buckets=8, execute_next_day=False),
+    ]
+    for cfg, row in zip(cfgs, build_positions_batch(features, cfgs)):
+        full = build_signals(features, cfg)
+        assert np.allclose(full["rainbow_position"], d["rainbow_position"])
+        lean = build_signals_lean(features, cfg, dtype=np.float64)
+        assert np.array_equal(full["pos"].to_numpy(), row)
+        assert np.array_equal(lean.pos, row)
+
+
+def test_rainbow_expanding_no_lookahead():
+    """Rainbow "expanding" point-in-time : un préfixe donne exactement les mêmes premières lignes"""
+    df = generate_test_data(n_days=900)
+    cols = ["rainbow_mid", "rainbow_min", "rainbow_max", "rainbow_position"]
+    full = calculate_rainbow_position(df, model="expanding")
+    for k in (2, 29, 30, 31, 100, 365, 899):
+        prefix = calculate_rainbow_position(df.iloc[:k], model="expanding")
+        pd.testing.assert_frame_equal(prefix[cols], full[cols].iloc[:k], check_exact=False, rtol=1e-12)
+
+    # Un futur différent ne change rien au passé ; le modèle "full" y est sensible (look-ahead)
+    shocked = df.assign(close=np.where(df.index >= 500, df["close"] * 10, df["close"]))
+    pd.testing.assert_frame_equal(
+        calculate_rainbow_position(shocked, model="expanding")[cols].iloc[:500], full[cols].iloc[:500],
+        check_exact=False, rtol=1e-12,
+    )
+    past_full = calculate_rainbow_position(df, model="full")["rainbow_position"].iloc[:500]
+    assert not np.allclose(calculate_rainbow_position(shocked, model="full")["rainbow_position"].iloc[:500], past_full)
+
+
+def test_strategy_state():
+    """Mise à jour jour par jour (O(1)) = build_signals en modèle Rainbow expanding"""
+    df = generate_test_data(n_days=800)
+    cfg = StrategyConfig(rainbow_model="expanding")
+    signals = build_signals(df, cfg)
+    state = StrategyState.from_history(df.iloc[:400], cfg)
+    targets, held = [], []
+    for row in df.iloc[400:].itertuples():
+        targets.append(state.update(row.date, row.fng, row.close))
+        held.append(state.pos)
+    assert np.allclose(targets, signals["pos_target"].iloc[400:], atol=1e-9)
+    assert np.allclose(held, signals["pos"].iloc[400:], atol=1e-9)
+
+    # Date rejouée ou antérieure : refusée sans toucher à l'état ; autre modèle Rainbow refusé
+    before = dict(vars(state))
+    last = df.iloc[-1]
+    for date in (last["date"], last["date"] - pd.Timedelta(days=3)):
+        assert _raises_value_error(lambda: state.update(date, last["fng"], last["close"]))
+    assert vars(state) == before
+    assert _raises_value_error(lambda: StrategyState(StrategyConfig(rainbow_model="full")))
+
+
 def main():
     print("=" * 80)
     print("🧪 TEST DE LA STRATÉGIE REFACTORISÉE")
@@ -99,6 +866,60 @@ def main():
     print(f"   Allocation moyenne:        {metrics['avg_allocation']:.1f}%")
     print(f"   Turnover total:            {metrics['turnover_total']:.2f}")
 
+    # Filtre de changement minimum (noyau compilé / batch)
+    print("\n6. Filtre de changement minimum...")
+    test_min_change_filter()
+    print("   ✓ Noyau simple et batch identiques à la boucle de référence")
+    test_batch_positions()
+    print("   ✓ Positions batch (N configs) et mode léger identiques à build_signals")
+    test_rainbow_quantile()
+    print("   ✓ Rainbow v2 (quantiles): bandes croissantes, positions bornées, moteurs cohérents")
+    test_rainbow_expanding_no_lookahead()
+    print("   ✓ Rainbow expanding sans look-ahead (préfixes identiques, futur sans effet)")
+    test_strategy_state()
+    print("   ✓ StrategyState (live, O(1)/jour) cohérent avec build_signals")
+    test_fng_levels()
+    print("   ✓ Paliers FNG: table 0-100 partagée = calcul direct")
+    test_indicator_cache_index()
+    print("   ✓ Cache d'indicateurs: même données, index différent → pas de mélange")
+    test_features_existing_rainbow_columns()
+    print("   ✓ Colonnes Rainbow déjà présentes: recalculées sans doublon de colonnes")
+    test_allocation_table()
+    print("   ✓ Table d'allocation 101 × K = calcul direct (Rainbow quantifié)")
+    test_backtest_kernel()
+    print("   ✓ Noyau de backtest fusionné = métriques pandas")
+    test_backtest_batch()
+    print("   ✓ Backtest batch par blocs = backtests individuels")
+    test_monte_carlo()
+    print("   ✓ Monte Carlo (bootstrap par blocs) reproductible")
+    test_metrics_accumulator()
+    print("   ✓ Accumulateur de métriques en flux (fusion de segments) = backtest complet")
+    test_compute_metrics_batch()
+    print("   ✓ Métriques vectorisées (N × jours) = compute_metrics")
+    test_rolling_metrics()
+    print("   ✓ Métriques glissantes O(n) = calcul naïf")
+    test_walk_forward_prefix()
+    print("   ✓ Walk-forward par sommes préfixes (un seul backtest)")
+    test_quality()
+    print("   ✓ Contrôle qualité: diagnostic, comblement des trous, garde-fou des points d'entrée")
+    test_resample()
+    print("   ✓ Ré-échantillonnage daté en fin de période + pyramide de résolutions")
+    test_append_daily()
+    print("   ✓ Ajouts quotidiens (jour + semaine) = reconstruction complète, prix en retard inclus")
+
+    # Téléchargeur CoinGecko sur serveur local
+    print("\n7. Téléchargeur CoinGecko (serveur local)...")
+    test_coingecko_downloader()
+    print("   ✓ 5 ans recollés sans trou ni doublon, malgré les réponses 429")
+    test_read_price_csv()
+    print("   ✓ CSV intraday par blocs: décimales tardives, agrégat journalier OHLC")
+    test_data_cache()
+    print("   ✓ Cache local: complément tête/queue, lecture offline, repli sur le cache")
+    test_snapshot_roundtrip()
+    print("   ✓ Snapshot colonnaire: relecture memmap identique, LATEST atomique, rotation des versions")
+    test_load_all_timeout()
+    print("   ✓ load_all: délai global respecté, repli sur le cache, threads daemon")
+
     # Test avec différents paramètres
     print("\n" + "=" * 80)
     print("🔬 TEST AVEC PARAMÈTRES AGRESSIFS")